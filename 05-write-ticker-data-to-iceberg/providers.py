@@ -0,0 +1,255 @@
+"""
+Market data providers for the ticker writer.
+
+Every provider returns an Arrow Table with SCHEMA for a list of tickers and a
+date range, so the writer does not depend on where the prices come from:
+
+- YFinanceProvider downloads prices from Yahoo Finance.
+- LocalFileProvider reads the sample prices in data/ticker-data.
+- SyntheticProvider generates deterministic prices for any number of tickers
+  and days, for offline runs and benchmarks.
+"""
+
+import glob
+import json
+import os
+import zlib
+from abc import ABC, abstractmethod
+from datetime import date
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+
+SCHEMA = pa.schema([
+    ("ticker", pa.string()),
+    ("date", pa.date32()),
+    ("open", pa.float64()),
+    ("close", pa.float64()),
+    ("volume", pa.int64()),
+])
+
+
+class MarketDataProvider(ABC):
+    """
+    Base class for market data providers.
+    """
+
+    @abstractmethod
+    def get_ticker_data(self, ticker_list: list[str], start_date_str: str, end_date_str: str) -> pa.Table:
+        """
+        Get daily prices for the given tickers.
+
+        Args:
+            ticker_list: Stock ticker symbols (e.g., ['AAPL', 'MSFT', 'GOOGL'])
+            start_date_str: First date in YYYY-MM-DD format
+            end_date_str: Date after the last date in YYYY-MM-DD format
+
+        Returns:
+            Arrow Table with columns: ticker, date, open, close, volume
+        """
+
+
+def yfinance_to_arrow(data: pd.DataFrame, ticker_list: list[str]) -> pa.Table:
+    """
+    Convert a yfinance download grouped by ticker into an Arrow Table.
+
+    The (ticker, price) column levels are reshaped into ticker-major columns
+    with NumPy and converted to Arrow in one pass, with the types of SCHEMA
+    applied directly. Dates on which a ticker has no prices at all are
+    dropped.
+
+    Args:
+        data: DataFrame returned by yf.download(..., group_by='ticker')
+        ticker_list: Tickers to extract, in output order
+
+    Returns:
+        Arrow Table with columns: ticker, date, open, close, volume
+    """
+    if data.empty:
+        return SCHEMA.empty_table()
+
+    tickers = [ticker for ticker in ticker_list if ticker in data.columns.levels[0]]
+    if not tickers:
+        return SCHEMA.empty_table()
+
+    def price_column(price: str) -> np.ndarray:
+        # One column per ticker; transpose so all dates of a ticker are adjacent
+        return data.xs(price, axis=1, level=1)[tickers].to_numpy(dtype=np.float64).T.ravel()
+
+    opens = price_column("Open")
+    closes = price_column("Close")
+    volumes = price_column("Volume")
+
+    # Drop the time zone so that each timestamp maps to its local trading date
+    index = data.index.tz_localize(None) if data.index.tz is not None else data.index
+
+    num_dates = len(index)
+    tickers_col = np.repeat(np.array(tickers, dtype=object), num_dates)
+    dates_col = np.tile(index.to_numpy().astype("datetime64[D]"), len(tickers))
+
+    keep = ~(np.isnan(opens) & np.isnan(closes) & np.isnan(volumes))
+
+    return pa.Table.from_arrays(
+        [
+            pa.array(tickers_col[keep], type=pa.string()),
+            pa.array(dates_col[keep], type=pa.date32()),
+            pa.array(opens[keep], type=pa.float64(), from_pandas=True),
+            pa.array(closes[keep], type=pa.float64(), from_pandas=True),
+            pa.array(volumes[keep], type=pa.int64(), from_pandas=True),
+        ],
+        schema=SCHEMA,
+    )
+
+
+class YFinanceProvider(MarketDataProvider):
+    """
+    Downloads prices from Yahoo Finance.
+    """
+
+    def get_ticker_data(self, ticker_list: list[str], start_date_str: str, end_date_str: str) -> pa.Table:
+        # Imported here so that the offline providers work without yfinance
+        import yfinance as yf
+
+        data = yf.download(
+            ",".join(ticker_list),
+            start=start_date_str,
+            end=end_date_str,
+            group_by='ticker'
+        )
+
+        return yfinance_to_arrow(data, ticker_list)
+
+
+class LocalFileProvider(MarketDataProvider):
+    """
+    Reads prices from a directory of JSON files, like data/ticker-data.
+
+    Each file holds concatenated JSON objects with the SCHEMA fields. Files
+    may overlap; a ticker and date that appear more than once are read once.
+    """
+
+    def __init__(self, data_dir: str):
+        self.data_dir = data_dir
+        self._records = None
+
+    def _load(self) -> dict:
+        records = {}
+        decoder = json.JSONDecoder()
+
+        for path in sorted(glob.glob(os.path.join(self.data_dir, "*.json"))):
+            with open(path) as f:
+                text = f.read()
+
+            pos = 0
+            while True:
+                # Skip whitespace between the concatenated objects
+                while pos < len(text) and text[pos].isspace():
+                    pos += 1
+                if pos == len(text):
+                    break
+                record, pos = decoder.raw_decode(text, pos)
+                records[(record["ticker"], record["date"][:10])] = record
+
+        return records
+
+    def get_ticker_data(self, ticker_list: list[str], start_date_str: str, end_date_str: str) -> pa.Table:
+        if self._records is None:
+            self._records = self._load()
+
+        tickers = set(ticker_list)
+        rows = [
+            {
+                "ticker": ticker,
+                "date": date.fromisoformat(date_str),
+                "open": float(record["open"]),
+                "close": float(record["close"]),
+                "volume": int(record["volume"]),
+            }
+            for (ticker, date_str), record in self._records.items()
+            if ticker in tickers and start_date_str <= date_str < end_date_str
+        ]
+
+        order = {ticker: i for i, ticker in enumerate(ticker_list)}
+        rows.sort(key=lambda row: (order[row["ticker"]], row["date"]))
+
+        return pa.Table.from_pylist(rows, schema=SCHEMA)
+
+
+class SyntheticProvider(MarketDataProvider):
+    """
+    Generates a random walk of prices on business days.
+
+    Each ticker's walk starts at EPOCH and is seeded from the ticker name, so
+    a ticker always gets the same price on a given date, however the date
+    range is split up.
+    """
+
+    EPOCH = "1990-01-01"
+
+    def __init__(self, seed: int = 0):
+        self.seed = seed
+
+    @staticmethod
+    def ticker_names(num_tickers: int) -> list[str]:
+        """
+        Names for num_tickers synthetic tickers.
+        """
+        return [f"SYN{i:05d}" for i in range(num_tickers)]
+
+    def get_ticker_data(self, ticker_list: list[str], start_date_str: str, end_date_str: str) -> pa.Table:
+        start = max(np.datetime64(start_date_str, "D"), np.datetime64(self.EPOCH, "D"))
+        end = np.datetime64(end_date_str, "D")
+        if start >= end:
+            return SCHEMA.empty_table()
+
+        # Business days from EPOCH to the end date; we keep the ones from start
+        days = np.arange(np.datetime64(self.EPOCH, "D"), end)
+        days = days[np.is_busday(days)]
+        first = np.searchsorted(days, start)
+        dates = days[first:]
+
+        tickers, opens, closes, volumes = [], [], [], []
+        for ticker in ticker_list:
+            rng = np.random.default_rng([self.seed, zlib.crc32(ticker.encode())])
+            close = 100 * np.exp(np.cumsum(rng.normal(0, 0.02, len(days))))
+            open_ = close * (1 + rng.normal(0, 0.005, len(days)))
+            volume = rng.integers(100_000, 50_000_000, len(days))
+
+            tickers.append(np.full(len(dates), ticker, dtype=object))
+            opens.append(open_[first:])
+            closes.append(close[first:])
+            volumes.append(volume[first:])
+
+        return pa.Table.from_arrays(
+            [
+                pa.array(np.concatenate(tickers), type=pa.string()),
+                pa.array(np.tile(dates, len(ticker_list)), type=pa.date32()),
+                pa.array(np.concatenate(opens), type=pa.float64()),
+                pa.array(np.concatenate(closes), type=pa.float64()),
+                pa.array(np.concatenate(volumes), type=pa.int64()),
+            ],
+            schema=SCHEMA,
+        )
+
+
+def get_provider(data_source: str, data_dir: str = "", seed: int = 0) -> MarketDataProvider:
+    """
+    Create the provider for a DATA_SOURCE parameter value.
+
+    Args:
+        data_source: One of yfinance, local or synthetic
+        data_dir: Directory of JSON files for the local provider
+        seed: Seed for the synthetic provider
+
+    Returns:
+        The market data provider
+    """
+    if data_source == "yfinance":
+        return YFinanceProvider()
+    if data_source == "local":
+        return LocalFileProvider(data_dir)
+    if data_source == "synthetic":
+        return SyntheticProvider(seed)
+    raise ValueError(f"Unknown data source '{data_source}', expected yfinance, local or synthetic")
@@ -0,0 +1,144 @@
+"""
+Layout of the daily_ticker_data table.
+
+The table stores `date` as an Iceberg date and is partitioned by month(date),
+optionally also by bucket(ticker), so that readers filtering on dates only
+open the files of the matching months.
+
+Tables created before this layout store `date` as a string and are not
+partitioned. Iceberg cannot change a string column into a date column in
+place, so `migrate_table` rewrites such a table into the new layout.
+"""
+
+import polars as pl
+import pyarrow as pa
+from pyiceberg.catalog import load_catalog
+from pyiceberg.exceptions import CommitFailedException
+from pyiceberg.transforms import BucketTransform, MonthTransform
+from pyiceberg.types import DateType
+
+from providers import SCHEMA
+
+
+CATALOG_NAME = "default"
+NAMESPACE = "default"
+TABLE_NAME = "daily_ticker_data"
+
+# How often to try adding missing partition fields when other writers
+# commit to the table at the same time
+SPEC_UPDATE_ATTEMPTS = 3
+
+
+def has_date_type(iceberg_table) -> bool:
+    """
+    Whether the table stores `date` as an Iceberg date.
+    """
+    return isinstance(iceberg_table.schema().find_field("date").field_type, DateType)
+
+
+def missing_partition_fields(iceberg_table, ticker_buckets: int) -> list[tuple]:
+    """
+    The (source column, transform, name) of the partition fields the table
+    does not have yet.
+    """
+    existing = {field.name for field in iceberg_table.spec().fields}
+    missing = []
+    if "date_month" not in existing:
+        missing.append(("date", MonthTransform(), "date_month"))
+    if ticker_buckets > 0 and "ticker_bucket" not in existing:
+        missing.append(("ticker", BucketTransform(ticker_buckets), "ticker_bucket"))
+    return missing
+
+
+def apply_partition_spec(iceberg_table, ticker_buckets: int):
+    """
+    Add the month(date) partition field, and bucket(ticker) if ticker_buckets
+    is greater than 0, unless the table already has them. Files written
+    before the change keep their old partitioning.
+
+    Writers started together, e.g. by the fan-out app, may try to add the
+    fields at the same time. All but one of them then fail to commit, reload
+    the table and find the fields already there.
+
+    Args:
+        iceberg_table: PyIceberg table with a date-typed `date` column
+        ticker_buckets: Number of ticker buckets, 0 for none
+    """
+    for attempt in range(SPEC_UPDATE_ATTEMPTS):
+        missing = missing_partition_fields(iceberg_table, ticker_buckets)
+        if not missing:
+            return
+
+        try:
+            with iceberg_table.update_spec() as update:
+                for source_column, transform, name in missing:
+                    update.add_field(source_column, transform, name)
+        except CommitFailedException:
+            if attempt == SPEC_UPDATE_ATTEMPTS - 1:
+                raise
+            iceberg_table.refresh()
+            continue
+
+        print(f"Added partition fields: {', '.join(name for _, _, name in missing)}")
+        return
+
+
+def ensure_table_layout(ticker_buckets: int):
+    """
+    Check that daily_ticker_data has the date-typed layout and add any
+    missing partition fields.
+
+    Raises:
+        RuntimeError: If the table still has the original string-typed layout
+    """
+    catalog = load_catalog(CATALOG_NAME)
+    iceberg_table = catalog.load_table((NAMESPACE, TABLE_NAME))
+
+    if not has_date_type(iceberg_table):
+        raise RuntimeError(
+            f"Table '{TABLE_NAME}' stores dates as strings. "
+            "Run the app once with MIGRATE_TABLE=true to migrate it."
+        )
+
+    apply_partition_spec(iceberg_table, ticker_buckets)
+
+
+def migrate_table(ticker_buckets: int):
+    """
+    Rewrite a string-typed daily_ticker_data table into the date-typed,
+    partitioned layout.
+
+    The rows are copied into a staging table with the new layout, dates in
+    "YYYY-MM-DD" or "YYYY-MM-DD HH:MM:SS" format are parsed, and duplicate
+    (ticker, date) rows that this produces are dropped. The original table is
+    then dropped and the staging table renamed to take its place. If the
+    rename fails, the data remains in the staging table.
+
+    Args:
+        ticker_buckets: Number of ticker buckets, 0 for none
+    """
+    catalog = load_catalog(CATALOG_NAME)
+    identifier = (NAMESPACE, TABLE_NAME)
+    staging_identifier = (NAMESPACE, f"{TABLE_NAME}_migration")
+
+    iceberg_table = catalog.load_table(identifier)
+    if has_date_type(iceberg_table):
+        print(f"Table '{TABLE_NAME}' already stores dates as dates")
+        apply_partition_spec(iceberg_table, ticker_buckets)
+        return
+
+    data = pl.from_arrow(iceberg_table.scan().to_arrow()).with_columns(
+        pl.col("date").str.slice(0, 10).str.to_date()
+    ).unique(subset=["ticker", "date"], keep="last", maintain_order=True)
+
+    if catalog.table_exists(staging_identifier):
+        catalog.drop_table(staging_identifier)
+
+    staging = catalog.create_table(staging_identifier, schema=SCHEMA)
+    apply_partition_spec(staging, ticker_buckets)
+    staging.append(data.select(SCHEMA.names).to_arrow().cast(SCHEMA))
+
+    catalog.drop_table(identifier)
+    catalog.rename_table(staging_identifier, identifier)
+
+    print(f"Migrated {data.height} rows of '{TABLE_NAME}' to the date-typed, partitioned layout")
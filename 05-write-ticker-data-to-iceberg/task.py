@@ -1,18 +1,37 @@
 import tower
 from datetime import datetime, timedelta
+import polars as pl
 import pyarrow as pa
-import yfinance as yf
+import pyarrow.compute as pc
 import os
+import time
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
 
+from providers import SCHEMA, MarketDataProvider, SyntheticProvider, get_provider
+from table_layout import ensure_table_layout, migrate_table
 
 
-def get_ticker_data(tickers: str, pull_date_str: str, end_date_str: str) -> pa.Table:
+# Records which chunks of a backfill have been written, so that a failed
+# backfill can be resumed without downloading those chunks again.
+BACKFILL_PROGRESS_SCHEMA = pa.schema([
+    ("chunk_id", pa.string()),
+    ("tickers", pa.string()),
+    ("start_date", pa.string()),
+    ("end_date", pa.string()),
+    ("rows", pa.int64()),
+    ("completed_at", pa.string()),
+])
+
+
+def get_ticker_data(provider: MarketDataProvider, tickers: str, pull_date_str: str, end_date_str: str) -> pa.Table:
     """
-    Download stock data for specific tickers and date from Yahoo Finance.
+    Get stock data for specific tickers and dates from a market data provider.
     
     Args:
-        tickers: List of stock ticker symbols (e.g., ['AAPL', 'MSFT', 'GOOGL'])
-        date: Date string in YYYY-MM-DD format
+        provider: The market data provider, e.g. Yahoo Finance
+        tickers: Comma-separated stock ticker symbols (e.g., 'AAPL,MSFT,GOOGL')
+        pull_date_str: Date string in YYYY-MM-DD format
+        end_date_str: Optional end date (exclusive) in YYYY-MM-DD format
         
     Returns:
         Arrow Table with columns: ticker, date, open, close, volume
@@ -21,45 +40,232 @@ def get_ticker_data(tickers: str, pull_date_str: str, end_date_str: str) -> pa.T
     pull_date = datetime.strptime(pull_date_str, "%Y-%m-%d")
     
     if end_date_str == "":
-        end_date = pull_date + timedelta(days=1)
-        end_date = end_date.strftime("%Y-%m-%d")
-    else:
-        end_date = datetime.strptime(end_date_str, "%Y-%m-%d")
+        end_date_str = (pull_date + timedelta(days=1)).strftime("%Y-%m-%d")
     
-    # Download data for all tickers
-    data = yf.download(
-        tickers,
-        start=pull_date,
-        end=end_date,
-        group_by='ticker'
-    )
-    
-    # Initialize empty list to store rows
-    rows = []
     ticker_list = [ticker.strip() for ticker in tickers.split(",")]
 
-    for ticker in ticker_list:
-        if ticker in data.columns.levels[0]:
-            ticker_data = data[ticker]
-            if not ticker_data.empty:
-                for date, row in ticker_data.iterrows():
-                    rows.append({
-                        'ticker': ticker,
-                        'date': date.strftime("%Y-%m-%d"),
-                        'open': row['Open'],
-                        'close': row['Close'],
-                        'volume': int(row['Volume'])
-                    })
-    
-    # Create Polars DataFrame
-    return pa.Table.from_pylist(rows)
+    return provider.get_ticker_data(ticker_list, pull_date_str, end_date_str)
+
+
+def write_ticker_data(table, data: pa.Table):
+    """
+    Write ticker data to the table, upserting only the rows whose keys may
+    already exist.
+
+    Upserting has to join the incoming rows against the data in the table,
+    but on daily runs the keys are almost always new. So we first probe the
+    table for existing (ticker, date) keys among the incoming tickers and
+    within the incoming date range. The filter is pushed down into the
+    Iceberg scan, so files whose column statistics rule out a match are not
+    read. Rows with new keys are appended with a plain insert, and only rows
+    with existing keys go through upsert.
+
+    Args:
+        table: The daily_ticker_data table
+        data: Arrow Table with SCHEMA
+
+    Returns:
+        The table after the write
+    """
+    if data.num_rows == 0:
+        print("No rows to write")
+        return table
+
+    start = time.perf_counter()
+    date_range = pc.min_max(data["date"])
+    existing = table.to_polars().filter(
+        pl.col("ticker").is_in(pc.unique(data["ticker"]).to_pylist())
+        & (pl.col("date") >= date_range["min"].as_py())
+        & (pl.col("date") <= date_range["max"].as_py())
+    ).select("ticker", "date").collect()
+    probe_secs = time.perf_counter() - start
+
+    if existing.is_empty():
+        new_rows, overlapping_rows = data, None
+    else:
+        incoming = pl.from_arrow(data)
+        new_rows = incoming.join(existing, on=["ticker", "date"], how="anti").to_arrow().cast(SCHEMA)
+        overlapping_rows = incoming.join(existing, on=["ticker", "date"], how="semi").to_arrow().cast(SCHEMA)
+
+    inserted, updated = 0, 0
+    insert_secs, upsert_secs = 0.0, 0.0
+
+    if new_rows.num_rows > 0:
+        start = time.perf_counter()
+        table = table.insert(new_rows)
+        insert_secs = time.perf_counter() - start
+        inserted += new_rows.num_rows
+
+    if overlapping_rows is not None and overlapping_rows.num_rows > 0:
+        # rows_affected() is a running total over every write to the table
+        # object, including the insert above and earlier backfill chunks,
+        # so only its change during the upsert is counted
+        stats = table.rows_affected()
+        inserts_before, updates_before = stats.inserts, stats.updates
+
+        start = time.perf_counter()
+        table = table.upsert(overlapping_rows, join_cols=['ticker', 'date'])
+        upsert_secs = time.perf_counter() - start
+
+        stats = table.rows_affected()
+        inserted += stats.inserts - inserts_before
+        updated += stats.updates - updates_before
+
+    print(f"Probed {existing.height} existing keys in {probe_secs:.2f}s")
+    print(f"Insert path: {new_rows.num_rows} rows in {insert_secs:.2f}s")
+    print(f"Upsert path: {0 if overlapping_rows is None else overlapping_rows.num_rows} rows in {upsert_secs:.2f}s")
+    print(f"Inserted {inserted} rows, updated {updated} rows")
+
+    return table
+
+
+def plan_backfill_chunks(ticker_list: list[str], pull_date_str: str, end_date_str: str,
+                         chunk_tickers: int, chunk_days: int) -> list[dict]:
+    """
+    Split a backfill into chunks of at most chunk_tickers tickers and
+    chunk_days days.
+
+    Args:
+        ticker_list: Tickers to backfill
+        pull_date_str: First date of the backfill in YYYY-MM-DD format
+        end_date_str: Date after the last date of the backfill in YYYY-MM-DD format
+        chunk_tickers: Maximum number of tickers per chunk
+        chunk_days: Maximum number of days per chunk
+
+    Returns:
+        List of chunks with chunk_id, tickers, start_date and end_date keys
+    """
+    pull_date = datetime.strptime(pull_date_str, "%Y-%m-%d")
+    end_date = datetime.strptime(end_date_str, "%Y-%m-%d")
+
+    chunks = []
+    for i in range(0, len(ticker_list), chunk_tickers):
+        tickers = ",".join(ticker_list[i:i + chunk_tickers])
+
+        start = pull_date
+        while start < end_date:
+            stop = min(start + timedelta(days=chunk_days), end_date)
+            start_str, stop_str = start.strftime("%Y-%m-%d"), stop.strftime("%Y-%m-%d")
+            chunks.append({
+                "chunk_id": f"{start_str}:{stop_str}:{tickers}",
+                "tickers": tickers,
+                "start_date": start_str,
+                "end_date": stop_str,
+            })
+            start = stop
 
+    return chunks
+
+
+# The market data provider of a backfill worker process. It is created once
+# per worker by init_worker, so that a provider such as LocalFileProvider
+# loads its data once per worker rather than once per chunk.
+_worker_provider = None
+
+
+def init_worker(data_source: str, data_dir: str):
+    """
+    Create the market data provider of a backfill worker process.
+    """
+    global _worker_provider
+    _worker_provider = get_provider(data_source, data_dir)
+
+
+def fetch_chunk(chunk: dict) -> tuple[dict, pa.Table]:
+    """
+    Download the data of one backfill chunk. Runs in a worker process.
+    """
+    return chunk, get_ticker_data(_worker_provider, chunk["tickers"], chunk["start_date"], chunk["end_date"])
+
+
+def run_backfill(table, data_source: str, data_dir: str, ticker_list: list[str], pull_date_str: str, end_date_str: str,
+                 chunk_tickers: int, chunk_days: int, max_workers: int):
+    """
+    Backfill the table chunk by chunk.
+
+    Chunks are downloaded concurrently by at most max_workers worker
+    processes. yf.download keeps its results in module-level state, so
+    concurrent downloads need separate processes rather than threads. Every
+    worker creates its own provider once, from data_source and data_dir. Each
+    chunk is written as soon as it arrives and then recorded in the
+    daily_ticker_data_backfill_progress table. Chunks already recorded there
+    are skipped, so re-running a failed backfill resumes where it stopped.
+    No more than max_workers chunks are waiting to be written at a time,
+    which bounds memory use.
+
+    Args:
+        table: The daily_ticker_data table
+        data_source: The market data provider, one of yfinance, local or synthetic
+        data_dir: Directory of JSON files for the local provider
+        ticker_list: Tickers to backfill
+        pull_date_str: First date of the backfill in YYYY-MM-DD format
+        end_date_str: Date after the last date of the backfill in YYYY-MM-DD format
+        chunk_tickers: Maximum number of tickers per chunk
+        chunk_days: Maximum number of days per chunk
+        max_workers: Maximum number of concurrent downloads
+    """
+    progress = tower.tables("daily_ticker_data_backfill_progress").create_if_not_exists(BACKFILL_PROGRESS_SCHEMA)
+    completed = set(progress.read()["chunk_id"].to_list())
+
+    chunks = plan_backfill_chunks(ticker_list, pull_date_str, end_date_str, chunk_tickers, chunk_days)
+    pending = [chunk for chunk in chunks if chunk["chunk_id"] not in completed]
+
+    print(f"Backfill chunks: {len(chunks)} total, {len(chunks) - len(pending)} already completed")
+
+    total_rows = 0
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=init_worker,
+                             initargs=(data_source, data_dir)) as executor:
+        in_flight = set()
+
+        while pending or in_flight:
+            # Keep at most max_workers downloads running
+            while pending and len(in_flight) < max_workers:
+                in_flight.add(executor.submit(fetch_chunk, pending.pop(0)))
+
+            done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+
+            for future in done:
+                chunk, data = future.result()
+
+                table = write_ticker_data(table, data)
+
+                progress = progress.upsert(pa.Table.from_pylist([{
+                    **chunk,
+                    "rows": data.num_rows,
+                    "completed_at": datetime.now().isoformat(timespec="seconds"),
+                }], schema=BACKFILL_PROGRESS_SCHEMA), join_cols=['chunk_id'])
+
+                total_rows += data.num_rows
+                num_tickers = len(chunk["tickers"].split(","))
+                print(f"Chunk {chunk['start_date']}..{chunk['end_date']} ({num_tickers} tickers): {data.num_rows} rows")
+
+    print(f"Backfill finished: {total_rows} rows written")
 
 
 def main():
     pull_date_str = os.getenv("PULL_DATE", "")
     end_date_str = os.getenv("END_DATE", "")
     tickers_str = os.getenv("TICKERS", "")
+    backfill = os.getenv("BACKFILL", "false").lower() == "true"
+    chunk_tickers = int(os.getenv("CHUNK_TICKERS", "50"))
+    chunk_days = int(os.getenv("CHUNK_DAYS", "90"))
+    max_workers = int(os.getenv("MAX_WORKERS", "4"))
+    data_source = os.getenv("DATA_SOURCE", "yfinance")
+    data_dir = os.getenv("DATA_DIR", "../data/ticker-data")
+    synthetic_tickers = int(os.getenv("SYNTHETIC_TICKERS", "0"))
+    migrate = os.getenv("MIGRATE_TABLE", "false").lower() == "true"
+    ticker_buckets = int(os.getenv("TICKER_BUCKETS", "0"))
+
+    # Migrate a table with the original string-typed layout and exit
+    if migrate:
+        migrate_table(ticker_buckets)
+        return
+
+    provider = get_provider(data_source, data_dir)
+
+    # The synthetic provider can make up any number of tickers
+    if data_source == "synthetic" and synthetic_tickers > 0:
+        tickers_str = ",".join(SyntheticProvider.ticker_names(synthetic_tickers))
 
     # Set pull_date_str to yesterday if empty
     if pull_date_str == "":
@@ -71,34 +277,48 @@ def main():
         return
 
     ###
-    # Step 1: Download ticker data from Yahoo Finance 
-    #   and store into an Arrow Table
+    # Step 1: Get a reference to the table in Tower. 
+    #   If it doesn't exist, create it. The table is partitioned by month,
+    #   so readers filtering on dates only open the files they need.
     ###
 
-    data = get_ticker_data(tickers_str,pull_date_str,end_date_str)
+    tower.tables("daily_ticker_data").create_if_not_exists(SCHEMA)
+    ensure_table_layout(ticker_buckets)
 
+    # Load the table after any partition spec change so our writes use it
+    table = tower.tables("daily_ticker_data").load()
+
+    if backfill:
+        # Exit if END_DATE parameter is not set, a backfill needs a date range
+        if end_date_str == "":
+            print("END_DATE parameter must be set for a backfill")
+            return
+
+        ticker_list = [ticker.strip() for ticker in tickers_str.split(",")]
+        run_backfill(table, data_source, data_dir, ticker_list, pull_date_str, end_date_str,
+                     chunk_tickers, chunk_days, max_workers)
+        return
 
     ###
-    # Step 2: Get a reference to the table in Tower. 
-    #   If it doesn't exist, create it.
+    # Step 2: Download ticker data from the market data provider
+    #   (Yahoo Finance by default) and store into an Arrow Table
     ###
 
-    SCHEMA = pa.schema([
-        ("ticker", pa.string()),
-        ("date", pa.string()),
-        ("open", pa.float64()),
-        ("close", pa.float64()),
-        ("volume", pa.int64()),
-    ])
+    start = time.perf_counter()
+    data = get_ticker_data(provider,tickers_str,pull_date_str,end_date_str)
+    fetch_secs = time.perf_counter() - start
 
-    table = tower.tables("daily_ticker_data").create_if_not_exists(SCHEMA)
-  
     ###
-    # Step 3: Upsert new stats into the table. 
-    #   Use Upsert to make the pipeline idempotent.
+    # Step 3: Write new stats into the table. 
+    #   Rows that may already exist are upserted to make the pipeline
+    #   idempotent, all other rows are simply appended.
     ###
-    table = table.upsert(data,join_cols=['ticker','date'])
-    #table.insert(data)
+    start = time.perf_counter()
+    table = write_ticker_data(table, data)
+    write_secs = time.perf_counter() - start
+
+    print(f"Fetched {data.num_rows} rows from {data_source} in {fetch_secs:.2f}s")
+    print(f"Wrote {data.num_rows} rows in {write_secs:.2f}s")
 
  
 if __name__ == "__main__":
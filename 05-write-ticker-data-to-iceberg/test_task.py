@@ -0,0 +1,46 @@
+import pyarrow.compute as pc
+import pytest
+from pyiceberg.catalog.sql import SqlCatalog
+from tower._tables import Table
+
+from providers import SCHEMA, SyntheticProvider
+from task import write_ticker_data
+
+
+@pytest.fixture
+def table(tmp_path):
+    catalog = SqlCatalog("test", uri=f"sqlite:///{tmp_path}/catalog.db", warehouse=f"file://{tmp_path}")
+    catalog.create_namespace("default")
+    iceberg_table = catalog.create_table(("default", "daily_ticker_data"), schema=SCHEMA)
+    return Table(None, iceberg_table)
+
+
+def written_counts(capsys) -> str:
+    return [line for line in capsys.readouterr().out.splitlines() if line.startswith("Inserted ")][-1]
+
+
+def test_write_new_and_overlapping_rows(table, capsys):
+    provider = SyntheticProvider()
+    table = write_ticker_data(table, provider.get_ticker_data(["AAA", "BBB"], "2025-01-01", "2025-01-11"))
+    assert written_counts(capsys) == "Inserted 16 rows, updated 0 rows"
+
+    # 4 days overlap the first write, 10 days are new
+    data = provider.get_ticker_data(["AAA", "BBB"], "2025-01-07", "2025-01-25")
+    table = write_ticker_data(table, data)
+    assert written_counts(capsys) == "Inserted 20 rows, updated 8 rows"
+
+    assert table.to_polars().collect().height == 36
+
+
+def test_counts_do_not_carry_over_between_writes(table, capsys):
+    # Backfill chunks are all written through the same table object
+    provider = SyntheticProvider()
+    data = provider.get_ticker_data(["AAA"], "2025-01-01", "2025-01-11")
+    table = write_ticker_data(table, data)
+    capsys.readouterr()
+
+    # Upsert only updates rows whose values changed
+    for i in range(1, 3):
+        revised = data.set_column(3, "close", pc.add(data["close"], float(i)))
+        table = write_ticker_data(table, revised)
+        assert written_counts(capsys) == "Inserted 0 rows, updated 8 rows"
@@ -0,0 +1,107 @@
+"""
+Benchmark for the trend computation in `task.py`.
+
+Compares the closed-form rolling-sum trend in `add_trend_column` against the
+original implementation, which fitted a scikit-learn LinearRegression for
+every window of every ticker, on synthetic data. Both results are checked to
+be equal before timings are reported.
+
+Usage:
+
+    BENCH_TICKERS=500 BENCH_DAYS=1250 uv run python benchmark.py
+"""
+
+import os
+import time
+
+import numpy as np
+import polars as pl
+from sklearn.linear_model import LinearRegression
+
+from task import add_trend_column
+
+
+def add_trend_column_sklearn(df: pl.DataFrame, window_size: int = 30) -> pl.DataFrame:
+    """
+    The original per-window implementation of `add_trend_column`, kept here as
+    the reference for correctness and speed.
+    """
+    def compute_trend(prices):
+        if len(prices) < 2:
+            return np.nan
+        x = np.arange(len(prices)).reshape(-1, 1)
+        y = np.array(prices).reshape(-1, 1)
+        model = LinearRegression().fit(x, y)
+        return model.coef_[0][0]
+
+    result = []
+
+    for ticker, group_df in df.group_by("ticker", maintain_order=True):
+        closes = group_df["close"].to_list()
+        num_rows = len(closes)
+
+        if num_rows < window_size:
+            trends = [None] * num_rows
+        else:
+            trends = [None] * (window_size - 1)
+            for i in range(window_size - 1, num_rows):
+                window = closes[i - window_size + 1:i + 1]
+                trends.append(compute_trend(window))
+
+        group_df = group_df.with_columns(
+            pl.Series(f"trend_{window_size}", trends, dtype=pl.Float64)
+        )
+        result.append(group_df)
+
+    return pl.concat(result)
+
+
+def make_ticker_data(num_tickers: int, num_days: int, seed: int = 42) -> pl.DataFrame:
+    """
+    Build a random-walk price history for `num_tickers` tickers over
+    `num_days` days, sorted by ticker and date.
+    """
+    rng = np.random.default_rng(seed)
+    steps = rng.normal(0, 1, size=(num_tickers, num_days))
+    closes = 100 + np.cumsum(steps, axis=1)
+
+    return pl.DataFrame({
+        "ticker": np.repeat([f"T{i:04d}" for i in range(num_tickers)], num_days),
+        "day": np.tile(np.arange(num_days), num_tickers),
+        "close": closes.ravel(),
+    })
+
+
+def timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def main():
+    num_tickers = int(os.getenv("BENCH_TICKERS", "100"))
+    num_days = int(os.getenv("BENCH_DAYS", "750"))
+    window_size = int(os.getenv("BENCH_WINDOW", "30"))
+
+    df = make_ticker_data(num_tickers, num_days)
+    column = f"trend_{window_size}"
+
+    print(f"Tickers: {num_tickers}, days: {num_days}, rows: {df.height}, window: {window_size}")
+
+    expected, sklearn_secs = timed(add_trend_column_sklearn, df, window_size)
+    actual, rolling_secs = timed(add_trend_column, df, window_size)
+
+    np.testing.assert_allclose(
+        actual[column].to_numpy(),
+        expected[column].to_numpy(),
+        rtol=1e-9,
+        atol=1e-9,
+    )
+
+    print(f"sklearn per-window fits: {sklearn_secs:.3f}s")
+    print(f"closed-form rolling sums: {rolling_secs:.3f}s")
+    print(f"speedup: {sklearn_secs / rolling_secs:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,55 +1,69 @@
 import tower
 import polars as pl
+import pyarrow as pa
 from datetime import datetime, timedelta
 # We need the OS package to get parameters from the environment.
 import os
+import math
+
+# The widest rolling window (in rows, i.e. trading days) used by
+# `analyze_dataframe`. Only this many rows per ticker are needed to analyze
+# a single date.
+LOOKBACK_ROWS = 30
+
+# The companion table that stores the computed indicators, one row per ticker
+# and date.
+ANALYTICS_SCHEMA = pa.schema([
+    ("ticker", pa.string()),
+    ("date", pa.date32()),
+    ("close", pa.float64()),
+    ("ma_7", pa.float64()),
+    ("ma_30", pa.float64()),
+    ("volatility_30", pa.float64()),
+    ("trend_30", pa.float64()),
+])
 
 # 
 # These are a few helper functions to help with the overall analysis of data.
 #
-def add_trend_column(df: pl.DataFrame) -> pl.DataFrame:
+def add_trend_column(df: pl.DataFrame, window_size: int = 30) -> pl.DataFrame:
     """
-    `add_trend_column` is a helper function that does a linear regression to
-    understand the overall trend in the past 30 days of the data within the
-    DataFrame.
+    `add_trend_column` computes the slope of a least-squares linear regression
+    over the last `window_size` closing prices of each ticker, which tells us
+    the overall trend of the stock over that window.
+
+    Instead of fitting a model for every window, the slope is computed in
+    closed form from rolling sums over each ticker, so the cost is linear in
+    the number of rows. The DataFrame must be sorted by ticker and date.
 
     Args:
         df (pl.DataFrame): The input DataFrame containing stock data.
+        window_size (int): The number of days in the regression window.
 
     Returns:
-        pl.DataFrame: The DataFrame with an additional column for the trend.
+        pl.DataFrame: The DataFrame with an additional `trend_<window_size>`
+        column. The first `window_size - 1` rows of each ticker have no trend.
     """
-    import numpy as np
-    from sklearn.linear_model import LinearRegression
-
-    def compute_trend(prices):
-        if len(prices) < 2:
-            return np.nan
-        x = np.arange(len(prices)).reshape(-1, 1)
-        y = np.array(prices).reshape(-1, 1)
-        model = LinearRegression().fit(x, y)
-        return model.coef_[0][0]
-
-    result = []
-
-    for ticker, group_df in df.group_by("ticker", maintain_order=True):
-        closes = group_df["close"].to_list()
-        num_rows = len(closes)
-        
-        # Handle case where we have fewer than 30 data points
-        if num_rows < 30:
-            trends = [None] * num_rows
-        else:
-            trends = [None] * 29  # First 29 days have no trend
-            for i in range(29, num_rows):
-                window = closes[i-29:i+1]
-                slope = compute_trend(window)
-                trends.append(slope)
-
-        group_df = group_df.with_columns(pl.Series("trend_30", trends))
-        result.append(group_df)
-
-    return pl.concat(result)
+    if window_size < 2:
+        raise ValueError("window_size must be at least 2 to compute a trend")
+
+    n = window_size
+
+    # Within a window the x values are 0..n-1, so their mean and the sum of
+    # squared deviations are the same for every window.
+    x_mean = (n - 1) / 2
+    sxx = n * (n * n - 1) / 12
+
+    # Position of each row within its ticker. The sum of x*y over a window
+    # ending at row k is sum(k*y) - (k - n + 1) * sum(y).
+    k = pl.int_range(pl.len(), dtype=pl.Int64).cast(pl.Float64)
+    close = pl.col("close").cast(pl.Float64)
+
+    sum_y = close.rolling_sum(window_size=n)
+    sum_xy = (k * close).rolling_sum(window_size=n) - (k - (n - 1)) * sum_y
+    slope = (sum_xy - x_mean * sum_y) / sxx
+
+    return df.with_columns(slope.over("ticker").alias(f"trend_{window_size}"))
 
 def analyze_dataframe(df: pl.DataFrame) -> pl.DataFrame:
     """
@@ -65,11 +79,7 @@ def analyze_dataframe(df: pl.DataFrame) -> pl.DataFrame:
         pl.DataFrame: The processed DataFrame with additional columns for
         moving averages, volatility, and trend.
     """
-    df = df.with_columns(
-        pl.col("date").str.to_date()
-    )
-
-    # Ensure proper date types and sort
+    # Dates are stored as dates, so we only need to sort
     df = df.sort(["ticker", "date"])
 
     # Calculate moving averages and volatility using group_by().over()
@@ -96,8 +106,156 @@ def analyze_dataframe(df: pl.DataFrame) -> pl.DataFrame:
 # END analysis functions
 #
 
+def lookback_start_date(analyze_date: datetime, slack_days: int) -> datetime:
+    """
+    `lookback_start_date` returns the earliest date that has to be read to
+    analyze `analyze_date`. `LOOKBACK_ROWS` trading days are converted into
+    calendar days (5 trading days per 7 calendar days), and `slack_days` are
+    added to cover market holidays.
+
+    Args:
+        analyze_date (datetime): The date being analyzed.
+        slack_days (int): Extra calendar days to read for holidays.
+
+    Returns:
+        datetime: The first date to read from the table.
+    """
+    lookback_days = math.ceil(LOOKBACK_ROWS * 7 / 5) + slack_days
+    return analyze_date - timedelta(days=lookback_days)
+
+def read_date_range(table, start_date: datetime, end_date: datetime) -> pl.DataFrame:
+    """
+    `read_date_range` reads the rows of `table` with `start_date <= date <
+    end_date`. The filter is applied to the lazy `to_polars()` scan, so it is
+    pushed down into the Iceberg scan, where it prunes the month partitions
+    outside the range.
+
+    Args:
+        table: The Tower table to read.
+        start_date (datetime): The first date to read.
+        end_date (datetime): The first date not to read.
+
+    Returns:
+        pl.DataFrame: The matching rows.
+    """
+    return table.to_polars().filter(
+        (pl.col("date") >= start_date.date()) & (pl.col("date") < end_date.date())
+    ).collect()
+
+def load_ticker_data(analyze_date: datetime, incremental: bool, slack_days: int) -> pl.DataFrame:
+    """
+    `load_ticker_data` reads the `daily_ticker_data` table into a Polars
+    DataFrame. In incremental mode only the lookback window ending at
+    `analyze_date` is read, so the amount of data read stays constant as the
+    table grows.
+
+    Args:
+        analyze_date (datetime): The date being analyzed.
+        incremental (bool): Whether to read only the lookback window.
+        slack_days (int): Extra calendar days to read for holidays.
+
+    Returns:
+        pl.DataFrame: The ticker data.
+    """
+    table = tower.tables("daily_ticker_data").load()
+
+    if not incremental:
+        return table.read()
+
+    return read_date_range(
+        table,
+        lookback_start_date(analyze_date, slack_days),
+        analyze_date + timedelta(days=1),
+    )
+
+def update_ticker_analytics(analyze_date: datetime, mode: str, slack_days: int) -> pl.DataFrame:
+    """
+    `update_ticker_analytics` computes indicators for the dates that are not
+    yet in the `daily_ticker_analytics` table and upserts them on ticker and
+    date.
+
+    In `backfill` mode the indicators are computed for the full history of
+    `daily_ticker_data`. In `daily` mode we look up the last analyzed date of
+    every ticker and only compute the dates after it, reading just the
+    lookback window those dates need. The last analyzed dates are looked up
+    in the recent window of the analytics table that ends at `analyze_date`
+    (the same length as the lookback window), so neither read grows with
+    history. Tickers that were not analyzed in that window, because they are
+    new or were not updated for a while, get indicators from the earliest
+    last analyzed date onwards; run a backfill to fill in their older
+    history. If no ticker was analyzed in the window, `daily` mode falls
+    back to a backfill.
+
+    Args:
+        analyze_date (datetime): The last date to compute indicators for.
+        mode (str): Either `backfill` or `daily`.
+        slack_days (int): Extra calendar days to read for holidays.
+
+    Returns:
+        pl.DataFrame: The indicators for `analyze_date`, read back from the
+        analytics table.
+    """
+    source = tower.tables("daily_ticker_data").load()
+    analytics = tower.tables("daily_ticker_analytics").create_if_not_exists(ANALYTICS_SCHEMA)
+    end_date = analyze_date + timedelta(days=1)
+
+    last_dates = None
+    if mode == "daily":
+        # Only the recent window is scanned, so data files with older dates
+        # are pruned from the scan, and a ticker that stopped trading long
+        # ago cannot pull the watermark back.
+        window_start = lookback_start_date(analyze_date, slack_days)
+        last_dates = analytics.to_polars().filter(
+            (pl.col("date") >= window_start.date()) & (pl.col("date") < end_date.date())
+        ).group_by("ticker").agg(
+            pl.col("date").max().alias("last_date")
+        ).collect()
+
+        if last_dates.is_empty():
+            print(f"No dates analyzed since {window_start:%Y-%m-%d} in 'daily_ticker_analytics', running a backfill.")
+            last_dates = None
+
+    if last_dates is None:
+        df = analyze_dataframe(source.read())
+        new_rows = df.filter(pl.col("date") < end_date.date())
+    else:
+        watermark = last_dates["last_date"].min()
+        watermark = datetime(watermark.year, watermark.month, watermark.day)
+
+        df = analyze_dataframe(
+            read_date_range(source, lookback_start_date(watermark, slack_days), end_date)
+        )
+
+        # Keep only the dates after each ticker's last analyzed date.
+        new_rows = df.join(last_dates, on="ticker", how="left").filter(
+            pl.col("date") > pl.col("last_date").fill_null(watermark.date())
+        )
+
+    new_rows = new_rows.select(ANALYTICS_SCHEMA.names)
+
+    if new_rows.is_empty():
+        print("\nNo new dates to analyze.")
+    else:
+        analytics = analytics.upsert(
+            new_rows.to_arrow().cast(ANALYTICS_SCHEMA),
+            join_cols=["ticker", "date"],
+        )
+        stats = analytics.rows_affected()
+
+        print("\nAnalytics Statistics:")
+        print(f"Computed {new_rows.height} rows")
+        print(f"Inserted {stats.inserts} rows")
+        print(f"Updated {stats.updates} rows")
+
+    return analytics.to_polars().filter(
+        pl.col("date") == analyze_date.date()
+    ).collect()
+
 def main():
     analyze_date_str = os.getenv("ANALYZE_DATE", "")
+    incremental = os.getenv("INCREMENTAL", "true").lower() == "true"
+    lookback_slack_days = int(os.getenv("LOOKBACK_SLACK_DAYS", "10"))
+    analytics_mode = os.getenv("ANALYTICS_MODE", "none").lower()
 
     # Set analyze_date_str to yesterday if empty
     if analyze_date_str == "":
@@ -106,21 +264,32 @@ def main():
     else:
         analyze_date = datetime.strptime(analyze_date_str, "%Y-%m-%d")
 
-    ###
-    #
-    # Step 1: Load the Iceberg table into a Polars DataFrame.
-    #
-    ###
-    df = tower.tables("daily_ticker_data").load().read()
+    if analytics_mode in ("backfill", "daily"):
+        ###
+        #
+        # Step 1 + 2: Compute the indicators that are not yet stored in the
+        #   `daily_ticker_analytics` table, store them, and read back the
+        #   indicators for ANALYZE_DATE.
+        #
+        ###
+        df = update_ticker_analytics(analyze_date, analytics_mode, lookback_slack_days)
+    else:
+        ###
+        #
+        # Step 1: Load the Iceberg table into a Polars DataFrame. In incremental
+        #   mode we only read the days needed to analyze ANALYZE_DATE.
+        #
+        ###
+        df = load_ticker_data(analyze_date, incremental, lookback_slack_days)
 
-    ###
-    #
-    # Step 2: Analyze the Polars DataFrame accordingly.
-    #
-    ###
-    df = analyze_dataframe(df)
+        ###
+        #
+        # Step 2: Analyze the Polars DataFrame accordingly.
+        #
+        ###
+        df = analyze_dataframe(df)
 
-    df = df.filter(pl.col("date") == analyze_date)
+        df = df.filter(pl.col("date") == analyze_date.date())
 
     # This is the final DataFrame with the analysis fully applied. We output it
     # so we can see what's going on.
@@ -1,37 +1,41 @@
 import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pprint import pprint
 
-from core.readers.github import ReadGithubIssue
+from core.readers.github import ReadGithubIssue, ReadGithubIssues
 from core.transforms.github import GithubIssueToChat
 
 import tower
 import pyarrow as pa
 
 
+SYSTEM_PROMPT = "Summarize this GitHub Issue thread and identify options for addressing the original issue! Output as markdown."
 
-def save_messages_to_table(messages, repo_owner, repo, issue_number):
+
+def save_threads_to_table(threads, repo_owner, repo):
     """
-    Save messages to a Tower table.
-    
+    Save the messages of one or more issue threads to a Tower table, with a
+    single upsert.
+
     Args:
-        messages (list): List of message dictionaries with 'role' and 'content' keys
+        threads (dict): Issue number to its list of message dictionaries with 'role' and 'content' keys
         repo_owner (str): GitHub repository owner
         repo (str): GitHub repository name
-        issue_number (str): GitHub issue number
-        
+
     Returns:
         table
     """
-    # Convert messages list to PyArrow table
-    data = {
-        'repo_owner': [repo_owner] * len(messages),
-        'repo': [repo] * len(messages),
-        'issue_number': [int(issue_number)] * len(messages),
-        'thread_seq': list(range(len(messages))),
-        'role': [msg['role'] for msg in messages],
-        'content': [msg['content'] for msg in messages]
-    }
-    arrow_table = pa.Table.from_pydict(data)
+    # Convert messages lists to PyArrow table
+    data = {'repo_owner': [], 'repo': [], 'issue_number': [], 'thread_seq': [], 'role': [], 'content': []}
+    for issue_number, messages in threads.items():
+        data['repo_owner'].extend([repo_owner] * len(messages))
+        data['repo'].extend([repo] * len(messages))
+        data['issue_number'].extend([int(issue_number)] * len(messages))
+        data['thread_seq'].extend(range(len(messages)))
+        data['role'].extend(msg['role'] for msg in messages)
+        data['content'].extend(msg['content'] for msg in messages)
 
     # Define table schema
     table_schema = pa.schema([
@@ -42,23 +46,154 @@ def save_messages_to_table(messages, repo_owner, repo, issue_number):
         ("role", pa.string()),
         ("content", pa.string()),
     ])
+    arrow_table = pa.Table.from_pydict(data, schema=table_schema)
 
     # Get or create table reference
     table = tower.tables("issue_threads", namespace="github").create_if_not_exists(table_schema)
-    
+
     # Upsert data
     table = table.upsert(arrow_table, join_cols=['repo_owner','repo','issue_number','thread_seq'])
-    
+
     stats = table.rows_affected()
 
     # Print upsert statistics
     print("\nApp Statistics:")
-    print(f"Total issue thread messages processed: {len(messages)}")
+    print(f"Total issue threads processed: {len(threads)}")
+    print(f"Total issue thread messages processed: {arrow_table.num_rows}")
     print(f"Inserted {stats.inserts} messages")
     print(f"Updated {stats.updates} messages")
-        
-    return table 
 
+    return table
+
+
+def save_messages_to_table(messages, repo_owner, repo, issue_number):
+    """
+    Save messages to a Tower table.
+
+    Args:
+        messages (list): List of message dictionaries with 'role' and 'content' keys
+        repo_owner (str): GitHub repository owner
+        repo (str): GitHub repository name
+        issue_number (str): GitHub issue number
+
+    Returns:
+        table
+    """
+    return save_threads_to_table({issue_number: messages}, repo_owner, repo)
+
+
+def build_messages(issues, comments):
+    """
+    Convert an issue and its comments into a chat-like thread, after the
+    system prompt that instructs our LLM how to behave.
+    """
+    messages = [{"role": "system", "content": SYSTEM_PROMPT}]
+    messages.extend(GithubIssueToChat()(issues, comments))
+    return messages
+
+
+def summarize_issues(reader, llm, repo_owner, repo, issue_numbers, state, labels, max_llm_concurrency):
+    """
+    Read many issues and summarize each of them. Every issue is handed to the
+    LLM as soon as it has been read, with at most max_llm_concurrency LLM
+    requests in flight, so reading and inference overlap.
+
+    Returns:
+        dict: Issue number to its thread, with the summary as the last message
+        dict: Issue number to the exception reading or summarizing it failed with
+        dict: Per-stage statistics: items, seconds from the first start to the last end of the stage
+    """
+    threads, failures = {}, {}
+    stages = {
+        "read": {"items": 0, "comments": 0, "start": None, "end": None},
+        "summarize": {"items": 0, "start": None, "end": None},
+    }
+
+    lock = threading.Lock()
+
+    def summarize(messages):
+        stage = stages["summarize"]
+        with lock:
+            if stage["start"] is None:
+                stage["start"] = time.perf_counter()
+        response = llm.complete_chat(messages)
+        with lock:
+            stage["end"] = time.perf_counter()
+        return messages + [{"role": "assistant", "content": response}]
+
+    stages["read"]["start"] = time.perf_counter()
+    pending = {}
+    with ThreadPoolExecutor(max_workers=max_llm_concurrency) as executor:
+        readitems_by_issue = reader(repo_owner=repo_owner, repo=repo, issue_numbers=issue_numbers, state=state, labels=labels)
+        for issue_number, readitems, error in readitems_by_issue:
+            stages["read"]["end"] = time.perf_counter()
+            if error is not None:
+                failures[issue_number] = error
+                continue
+
+            stages["read"]["items"] += 1
+            stages["read"]["comments"] += len(readitems["comments"])
+            messages = build_messages(readitems["issues"], readitems["comments"])
+            pending[issue_number] = executor.submit(summarize, messages)
+
+        for issue_number, future in pending.items():
+            try:
+                threads[issue_number] = future.result()
+                stages["summarize"]["items"] += 1
+            except Exception as e:
+                failures[issue_number] = e
+
+    return threads, failures, stages
+
+
+def print_throughput(stages):
+    print("\nThroughput:")
+    for name, stage in stages.items():
+        if stage["start"] is None or stage["end"] is None:
+            print(f"  {name:<10} {stage['items']:>5} items")
+            continue
+        secs = stage["end"] - stage["start"]
+        rate = stage["items"] / secs if secs > 0 else float("inf")
+        extra = f", {stage['comments']} comments" if "comments" in stage else ""
+        extra += f", {stage['rows']} rows" if "rows" in stage else ""
+        print(f"  {name:<10} {stage['items']:>5} items{extra} in {secs:.2f}s ({rate:.1f} items/s)")
+
+
+def run_batch(repo_owner, repo, issue_numbers, state, labels, model_to_use, gh_cache_dir,
+              gh_max_concurrency, max_issue_concurrency, max_llm_concurrency):
+    """
+    Summarize many issues in one run and save all their threads with a
+    single upsert.
+    """
+    reader = ReadGithubIssues(token=os.getenv("GITHUB_TOKEN"), cache_dir=gh_cache_dir,
+                              max_concurrency=gh_max_concurrency, max_issue_concurrency=max_issue_concurrency)
+    llm = tower.llms(model_to_use)
+
+    start = time.perf_counter()
+    threads, failures, stages = summarize_issues(
+        reader, llm, repo_owner, repo, issue_numbers, state, labels, max_llm_concurrency
+    )
+
+    for issue_number in sorted(threads):
+        print("\n" + "="*80 + "\n" + f"SUMMARY OF RECOMMENDATIONS FOR GITHUB ISSUE #{issue_number}" + "\n" + "="*80)
+        print(threads[issue_number][-1]["content"])
+    print("="*80)
+
+    if threads:
+        stages["upsert"] = {"items": len(threads), "rows": sum(len(messages) for messages in threads.values())}
+        stages["upsert"]["start"] = time.perf_counter()
+        save_threads_to_table(threads, repo_owner, repo)
+        stages["upsert"]["end"] = time.perf_counter()
+
+    print(f"\nGitHub requests: {reader.github.requests}, unchanged (304): {reader.github.not_modified}, "
+          f"throttled: {reader.github.throttled_secs:.1f}s")
+    print_throughput(stages)
+    print(f"  total      {time.perf_counter() - start:.2f}s")
+
+    if failures:
+        for issue_number, error in sorted(failures.items()):
+            print(f"Issue #{issue_number} failed: {error}")
+        raise RuntimeError(f"{len(failures)} issues failed: {', '.join(str(number) for number in sorted(failures))}")
 
 
 def main():
@@ -68,11 +203,31 @@ def main():
     model_to_use = os.getenv("model_to_use")
     max_tokens_str = os.getenv("max_tokens")
     max_tokens = int(max_tokens_str) if max_tokens_str and max_tokens_str.strip() else None
+    gh_max_concurrency = int(os.getenv("gh_max_concurrency", "8"))
+    gh_cache_dir = os.path.expanduser(os.getenv("gh_cache_dir", "~/.cache/deepseek-summarize-github"))
+    gh_issue_numbers = [number.strip() for number in os.getenv("gh_issue_numbers", "").split(",") if number.strip()]
+    gh_issue_state = os.getenv("gh_issue_state", "").strip()
+    gh_issue_labels = os.getenv("gh_issue_labels", "").strip()
+    max_issue_concurrency = int(os.getenv("max_issue_concurrency", "4"))
+    max_llm_concurrency = int(os.getenv("max_llm_concurrency", "4"))
+
+    ###
+    # Batch mode: summarize a list of issues, or all issues with a state and
+    #   labels, in one run, and save them with a single upsert
+    ###
+    if gh_issue_numbers or gh_issue_state or gh_issue_labels:
+        run_batch(gh_repo_owner, gh_repo, gh_issue_numbers, gh_issue_state or None, gh_issue_labels or None,
+                  model_to_use, gh_cache_dir, gh_max_concurrency, max_issue_concurrency, max_llm_concurrency)
+        return
 
     ###
     # Step 1: Data Retrieval: Read the issue and all comments from Github
+    #   Pages are fetched concurrently, and pages that have not changed since
+    #   the last run are served from the ETag cache in gh_cache_dir
     ###
-    readitems = ReadGithubIssue()(repo_owner=gh_repo_owner, repo=gh_repo, issue_number=gh_issue_number)
+    reader = ReadGithubIssue(token=os.getenv("GITHUB_TOKEN"), cache_dir=gh_cache_dir, max_concurrency=gh_max_concurrency)
+    readitems = reader(repo_owner=gh_repo_owner, repo=gh_repo, issue_number=gh_issue_number)
+    print(f"GitHub requests: {reader.github.requests}, unchanged (304): {reader.github.not_modified}")
     issues, comments= readitems['issues'], readitems['comments']
 
     ###
@@ -80,18 +235,16 @@ def main():
     #   Each message in the chat are tagged with one of 3 roles: system, assistant, user
     #   The first message is the prompt by 'system' and instructs our LLM how to behave
     ###
-    chat = GithubIssueToChat()(issues,comments)
-    messages = [{"role": "system", "content": "Summarize this GitHub Issue thread and identify options for addressing the original issue! Output as markdown."}]
-    messages.extend(chat)
+    messages = build_messages(issues, comments)
 
     ###
     # Step 3: Inference: Ask the LLM to summarize the issue and provide recommendations
     #   Call the chat completion API of Ollama or HuggingFace
     ###
- 
+
     llm = tower.llms(model_to_use)
     response = llm.complete_chat(messages)
-    
+
     ###
     #  Step 4: Print the response and save it to a Tower table
     ###
@@ -107,5 +260,3 @@ def main():
 
 if __name__ == "__main__":
     main()
-
-
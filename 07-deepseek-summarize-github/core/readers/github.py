@@ -1,27 +1,223 @@
 from core.readers.dlt import Read
 import dlt
-from dlt.sources.helpers import requests
-from typing import Any, Dict, Optional, List
+import hashlib
+import json
+import os
+import threading
+import time
+import requests
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from requests.adapters import HTTPAdapter
+from urllib.parse import urlencode, urlparse, parse_qs, urlunparse
+from urllib3.util.retry import Retry
+from typing import Any, Dict, Optional, List, Tuple
+
+
+GITHUB_API_URL = "https://api.github.com"
+
+
+class GithubSession:
+    """
+    Pooled HTTP session for the GitHub API.
+
+    Every response is kept in a local ETag cache, and the next request for
+    the same URL is sent with If-None-Match/If-Modified-Since. An unchanged
+    page then comes back as a 304 and is served from the cache; with a token,
+    304s do not count against the rate limit.
+
+    Requests are throttled from the X-RateLimit-* headers: once fewer than
+    a tenth of the requests are left, the rest are spread out until the
+    limit resets, and when none are left we wait for the reset. Requests
+    from concurrent threads take turns: each one is given its own send
+    time, one interval after the previous one.
+    """
+
+    def __init__(self, token: str = None, cache_dir: str = None, max_concurrency: int = 8, pool_size: int = None):
+        self.max_concurrency = max_concurrency
+        self.cache_dir = cache_dir
+        if cache_dir is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+
+        self.session = requests.Session()
+        self.session.headers["Accept"] = "application/vnd.github+json"
+        self.authenticated = bool(token)
+        if token:
+            self.session.headers["Authorization"] = f"Bearer {token}"
+
+        retries = Retry(total=5, backoff_factor=1, status_forcelist=[500, 502, 503, 504], allowed_methods=["GET"])
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size or max_concurrency, max_retries=retries)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        self.lock = threading.Lock()
+        self.rate_limit = None
+        self.rate_remaining = None
+        self.rate_reset = None
+        self.next_send_at = 0.0
+
+        self.requests = 0
+        self.not_modified = 0
+        self.throttled_secs = 0.0
+
+    def cache_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, hashlib.sha256(key.encode()).hexdigest() + ".json")
+
+    def read_cache(self, key: str) -> Optional[Dict]:
+        if self.cache_dir is None or not os.path.exists(self.cache_path(key)):
+            return None
+        with open(self.cache_path(key)) as f:
+            return json.load(f)
+
+    def write_cache(self, key: str, entry: Dict):
+        if self.cache_dir is None:
+            return
+        path = self.cache_path(key)
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(temp_path, "w") as f:
+            json.dump(entry, f)
+        os.replace(temp_path, path)
+
+    def throttle(self, conditional: bool = False):
+        """
+        Wait as long as the rate limit asks before sending a request.
+
+        Args:
+            conditional: Whether the request is sent with If-None-Match or
+                If-Modified-Since. With a token, a 304 response to it does
+                not count against the rate limit.
+        """
+        with self.lock:
+            if self.rate_remaining is None:
+                return
+            now = time.time()
+            send_at = max(now, self.next_send_at)
+            if self.rate_remaining <= 0:
+                send_at = max(send_at, self.rate_reset)
+                interval = 0
+            elif self.rate_remaining < self.rate_limit / 10:
+                interval = max(self.rate_reset - now, 0) / self.rate_remaining
+            else:
+                interval = 0
+            # Take the next slot and count the request now, so concurrent
+            # requests wait for the slots after it
+            self.next_send_at = send_at + interval
+            if not (conditional and self.authenticated):
+                self.rate_remaining -= 1
+
+        wait = send_at - now
+        if wait > 0:
+            if wait > 5:
+                print(f"GitHub rate limit nearly used up, waiting {wait:.0f}s")
+            with self.lock:
+                self.throttled_secs += wait
+            time.sleep(wait)
+
+    def update_rate_limit(self, response):
+        headers = response.headers
+        if "X-RateLimit-Remaining" not in headers:
+            return
+        with self.lock:
+            self.rate_limit = int(headers.get("X-RateLimit-Limit", 60))
+            self.rate_remaining = int(headers["X-RateLimit-Remaining"])
+            self.rate_reset = int(headers.get("X-RateLimit-Reset", time.time()))
+
+    def is_rate_limited(self, response) -> bool:
+        return response.status_code in (403, 429) and (
+            "Retry-After" in response.headers or response.headers.get("X-RateLimit-Remaining") == "0"
+        )
+
+    def get(self, url: str, params: Dict = None) -> Tuple[Any, Dict]:
+        """
+        GET a GitHub API URL, or serve it from the ETag cache if it has not
+        changed.
+
+        Returns:
+            The JSON body and the parsed Link header of the response
+        """
+        key = f"{url}?{urlencode(sorted((params or {}).items()))}"
+        cached = self.read_cache(key)
+
+        headers = {}
+        if cached is not None:
+            if cached.get("etag"):
+                headers["If-None-Match"] = cached["etag"]
+            if cached.get("last_modified"):
+                headers["If-Modified-Since"] = cached["last_modified"]
+
+        for attempt in range(3):
+            self.throttle(conditional=bool(headers))
+            response = self.session.get(url, params=params, headers=headers, timeout=30)
+            self.update_rate_limit(response)
+            with self.lock:
+                self.requests += 1
+
+            if not self.is_rate_limited(response) or attempt == 2:
+                break
+
+            wait = int(response.headers.get("Retry-After", 0)) or max(self.rate_reset - time.time(), 1)
+            print(f"GitHub rate limit exceeded, retrying in {wait:.0f}s")
+            with self.lock:
+                self.throttled_secs += wait
+            time.sleep(wait)
+
+        if response.status_code == 304 and cached is not None:
+            with self.lock:
+                self.not_modified += 1
+            return cached["body"], response.links or cached["links"]
+
+        response.raise_for_status()
+        body = response.json()
+
+        self.write_cache(key, {
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "links": response.links,
+            "body": body,
+        })
+
+        return body, response.links
+
+
+def page_url(url: str, page: int) -> str:
+    """Set the page query parameter of a GitHub API URL."""
+    parts = urlparse(url)
+    query = parse_qs(parts.query)
+    query["page"] = [str(page)]
+    return urlunparse(parts._replace(query=urlencode(query, doseq=True)))
 
 
 class ReadGithub(Read):
 
-    def __init__(self, actionname:str = None):
+    def __init__(self, actionname:str = None, token:str = None, cache_dir:str = None, max_concurrency:int = 8,
+                 pool_size:int = None):
         super().__init__(actionname)
+        self.github = GithubSession(token=token, cache_dir=cache_dir, max_concurrency=max_concurrency, pool_size=pool_size)
 
     def fetch_github_data(self, base_github_url, suburl, params={}):
-        """Fetch data from GitHub API based on endpoint and params."""
+        """Fetch data from GitHub API based on endpoint and params.
+
+        The `last` link of the first page tells how many pages there are,
+        and the remaining pages are then fetched concurrently, yielded in
+        page order.
+        """
         url = f"{base_github_url}/{suburl}"
 
-        while True:
-            response = requests.get(url, params=params)
-            response.raise_for_status()
-            yield response.json()
+        data, links = self.github.get(url, params)
+        yield data
 
-            # Get next page
-            if "next" not in response.links:
-                break
-            url = response.links["next"]["url"]
+        if "last" in links:
+            last_url = links["last"]["url"]
+            last_page = int(parse_qs(urlparse(last_url).query)["page"][0])
+            urls = [page_url(last_url, page) for page in range(2, last_page + 1)]
+
+            with ThreadPoolExecutor(max_workers=self.github.max_concurrency) as executor:
+                for data, links in executor.map(self.github.get, urls):
+                    yield data
+
+        # Pages added since the last page was listed
+        while "next" in links:
+            data, links = self.github.get(links["next"]["url"])
+            yield data
 
     @dlt.source
     def github_source(self, base_github_url, entityspecs):
@@ -48,11 +244,14 @@ class ReadGithub(Read):
 
             suburl = e.get("suburl",entity)
 
+            # parallelized lets dlt extract the entities (e.g. an issue and
+            # its comments) at the same time instead of one after the other
             yield dlt.resource(
                 self.fetch_github_data(base_github_url, suburl, params),
                 name=entity,
                 write_disposition="merge",
                 primary_key="id",
+                parallelized=True,
             ).add_map(lambda doc: project_fields(doc, fields))
 
     def build_entityspec(self,
@@ -93,9 +292,79 @@ class ReadGithub(Read):
 class ReadGithubIssue(ReadGithub):
 
     def do(self, repo_owner, repo, issue_number, *args:Any, **kwargs: Any) -> Dict:
-        base_github_url = f"https://api.github.com/repos/{repo_owner}/{repo}"
+        base_github_url = f"{GITHUB_API_URL}/repos/{repo_owner}/{repo}"
         issues_endpoint = self.build_entityspec(entity="issues", issue_number=issue_number)
         comments_endpoint = self.build_entityspec(entity="comments", issue_number=issue_number)
         endpoints = [issues_endpoint,comments_endpoint]
         return super().do(base_github_url, endpoints, *args, **kwargs)
 
+
+class ReadGithubIssues(ReadGithub):
+    """
+    Read many issues of a repo and their comments, either a list of issue
+    numbers or the issues matching a state and labels. Issues are read
+    directly through the GitHub session rather than a dlt pipeline, up to
+    max_issue_concurrency at a time.
+    """
+
+    def __init__(self, actionname:str = None, token:str = None, cache_dir:str = None, max_concurrency:int = 8,
+                 max_issue_concurrency:int = 4):
+        super().__init__(actionname, token=token, cache_dir=cache_dir, max_concurrency=max_concurrency,
+                         pool_size=max_concurrency * max_issue_concurrency)
+        self.max_issue_concurrency = max_issue_concurrency
+
+    def project_fields(self, doc: Dict, entity: str) -> Dict:
+        fields = self.build_entityspec(entity=entity)["fields"]
+        return {k: doc[k] for k in fields if k in doc}
+
+    def list_issues(self, base_github_url, state:str = None, labels:str = None) -> List[Dict]:
+        params = {"per_page": 100}
+        if state is not None:
+            params["state"] = state
+        if labels is not None:
+            params["labels"] = labels
+
+        issues = [issue for page in self.fetch_github_data(base_github_url, "issues", params) for issue in page]
+        # The issues endpoint lists pull requests too
+        return [issue for issue in issues if "pull_request" not in issue]
+
+    def read_issue(self, base_github_url, issue_number, issue:Dict = None) -> Dict:
+        """Read an issue, unless it has been listed already, and its comments."""
+        if issue is None:
+            issue, _ = self.github.get(f"{base_github_url}/issues/{issue_number}")
+
+        comments = []
+        if issue.get("comments", 1) > 0:
+            pages = self.fetch_github_data(base_github_url, f"issues/{issue_number}/comments", {"per_page": 100})
+            comments = [comment for page in pages for comment in page]
+
+        return {
+            "issues": [self.project_fields(issue, "issues")],
+            "comments": [self.project_fields(comment, "comments") for comment in comments],
+        }
+
+    def do(self, repo_owner, repo, issue_numbers:List = None, state:str = None, labels:str = None,
+           *args:Any, **kwargs: Any):
+        """
+        Yields (issue_number, readitems, error) for every issue as soon as it
+        has been read, where readitems has the same 'issues' and 'comments'
+        lists as ReadGithubIssue returns, and error is the exception reading
+        the issue failed with, if any.
+        """
+        base_github_url = f"{GITHUB_API_URL}/repos/{repo_owner}/{repo}"
+
+        if issue_numbers:
+            listed = {int(number): None for number in issue_numbers}
+        else:
+            listed = {issue["number"]: issue for issue in self.list_issues(base_github_url, state, labels)}
+
+        with ThreadPoolExecutor(max_workers=self.max_issue_concurrency) as executor:
+            futures = {
+                executor.submit(self.read_issue, base_github_url, number, issue): number
+                for number, issue in listed.items()
+            }
+            for future in as_completed(futures):
+                try:
+                    yield futures[future], future.result(), None
+                except Exception as e:
+                    yield futures[future], None, e
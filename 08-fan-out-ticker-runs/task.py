@@ -2,11 +2,139 @@ import tower
 from datetime import datetime, timedelta
 import pyarrow as pa
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+
+def run_batch(batch_num: int, tickers: list[str], pull_date_str: str) -> dict:
+    """
+    Run the write-ticker-data-to-iceberg app for a batch of tickers and wait
+    for it to finish.
+
+    Args:
+        batch_num: Number of the batch, for reporting
+        tickers: Tickers to download in this run
+        pull_date_str: Date of stock data to pull in YYYY-MM-DD format
+
+    Returns:
+        Dict with the batch number, tickers, run status and wall time
+    """
+    params = {
+        "PULL_DATE": f"{pull_date_str}",
+        "TICKERS": ",".join(tickers)
+    }
+
+    start = time.perf_counter()
+    try:
+        run = tower.run_app("write-ticker-data-to-iceberg", parameters=params)
+        run = tower.wait_for_run(run)
+        successful = run.status_group == "successful"
+    except Exception as e:
+        print(f"Batch {batch_num} could not be run: {e}")
+        successful = False
+
+    return {
+        "batch": batch_num,
+        "tickers": tickers,
+        "successful": successful,
+        "seconds": time.perf_counter() - start,
+    }
+
+
+def run_fan_out(batches: list[list[str]], pull_date_str: str, max_parallel: int,
+                max_retries: int, retry_backoff_secs: float) -> dict:
+    """
+    Run all batches with at most max_parallel child runs in flight, handling
+    each child run as soon as it completes.
+
+    When a slot frees up, the next batch is started. A failed batch is split
+    in two, so that one bad ticker does not keep failing the others, and
+    retried after a backoff that doubles with every attempt, up to
+    max_retries retries per ticker.
+
+    Args:
+        batches: Batches of tickers
+        pull_date_str: Date of stock data to pull in YYYY-MM-DD format
+        max_parallel: Maximum number of child runs at the same time
+        max_retries: Maximum number of retries per ticker
+        retry_backoff_secs: Wait before the first retry
+
+    Returns:
+        Dict of ticker to a dict with its status, attempts and last run time
+    """
+    status = {
+        ticker: {"status": "pending", "attempts": 0, "seconds": 0.0}
+        for batch in batches for ticker in batch
+    }
+
+    # Work to do as (ready_at, tickers, attempt)
+    queue = [(0.0, batch, 1) for batch in batches]
+    in_flight = {}
+    batch_num = 0
+
+    with ThreadPoolExecutor(max_workers=max_parallel) as executor:
+        while queue or in_flight:
+            now = time.monotonic()
+
+            # Start ready work while slots are free
+            for item in [item for item in queue if item[0] <= now]:
+                if len(in_flight) >= max_parallel:
+                    break
+                queue.remove(item)
+                _, tickers, attempt = item
+                batch_num += 1
+                for ticker in tickers:
+                    status[ticker].update(status="running", attempts=attempt)
+                future = executor.submit(run_batch, batch_num, tickers, pull_date_str)
+                in_flight[future] = (tickers, attempt)
+
+            # Wait for the next completion, or until the next retry is due.
+            # While all slots are busy, queued work can only start once a
+            # child run completes, so we block until then.
+            timeout = None
+            if queue and len(in_flight) < max_parallel:
+                timeout = max(0.0, min(item[0] for item in queue) - time.monotonic())
+            if not in_flight:
+                time.sleep(timeout)
+                continue
+
+            done, _ = wait(in_flight, timeout=timeout, return_when=FIRST_COMPLETED)
+
+            for future in done:
+                tickers, attempt = in_flight.pop(future)
+                result = future.result()
+                outcome = "successful" if result["successful"] else "unsuccessful"
+                print(f"Batch {result['batch']} (attempt {attempt}): {len(tickers)} tickers, {outcome}, {result['seconds']:.1f}s")
+
+                for ticker in tickers:
+                    status[ticker]["seconds"] = result["seconds"]
+
+                if result["successful"]:
+                    for ticker in tickers:
+                        status[ticker]["status"] = "successful"
+                elif attempt <= max_retries:
+                    ready_at = time.monotonic() + retry_backoff_secs * 2 ** (attempt - 1)
+                    half = (len(tickers) + 1) // 2
+                    for part in (tickers[:half], tickers[half:]):
+                        if part:
+                            queue.append((ready_at, part, attempt + 1))
+                    for ticker in tickers:
+                        status[ticker]["status"] = "retrying"
+                else:
+                    for ticker in tickers:
+                        status[ticker]["status"] = "unsuccessful"
+
+    return status
 
 
 def main():
     pull_date_str = os.getenv("PULL_DATE", "")
     tickers_str = os.getenv("TICKERS", "")
+    batch_size = int(os.getenv("BATCH_SIZE", "10"))
+    max_parallel = int(os.getenv("MAX_PARALLEL", "5"))
+    max_retries = int(os.getenv("MAX_RETRIES", "2"))
+    retry_backoff_secs = float(os.getenv("RETRY_BACKOFF_SECONDS", "30"))
+    compact_after = os.getenv("COMPACT_AFTER", "false").lower() == "true"
 
     # Set pull_date_str to yesterday if empty
     if pull_date_str == "":
@@ -18,33 +146,47 @@ def main():
         return
 
     ###
-    # Step: Fan Out: Start the downloads of ticker data 
-    #   for each ticker in parallel.
+    # Step: Fan Out: Start the downloads of ticker data
+    #   in batches of BATCH_SIZE tickers, with at most MAX_PARALLEL
+    #   child runs at a time. Each child run writes its whole batch in
+    #   one commit, which keeps commit contention and small files down.
     ###
 
     ticker_list = [ticker.strip() for ticker in tickers_str.split(",")]
-    
-    # Process each ticker's data
-    child_runs = []
-    for ticker in ticker_list:
+    batches = [ticker_list[i:i + batch_size] for i in range(0, len(ticker_list), batch_size)]
 
-        params = {
-            "PULL_DATE": f"{pull_date_str}",
-            "TICKERS": f"{ticker}"
-        }
-
-        run = tower.run_app("write-ticker-data-to-iceberg", parameters=params)
-        child_runs.append(run)
+    print(f"Running {len(ticker_list)} tickers in {len(batches)} batches, at most {max_parallel} at a time")
 
     ###
-    # Step: Wait for all child runs to complete
+    # Step: Handle child runs as they complete, starting new batches
+    #   as slots free up and retrying failed ones
     ###
 
-    (successful_runs,unsuccessful_runs) = tower.wait_for_runs(child_runs)
+    start = time.perf_counter()
+    status = run_fan_out(batches, pull_date_str, max_parallel, max_retries, retry_backoff_secs)
+    total_secs = time.perf_counter() - start
+
+    print(f"\n{'Ticker':<10} {'Status':<14} {'Attempts':>8} {'Last run':>10}")
+    for ticker, ticker_status in status.items():
+        print(f"{ticker:<10} {ticker_status['status']:<14} {ticker_status['attempts']:>8} {ticker_status['seconds']:>9.1f}s")
+
+    successful = [t for t, s in status.items() if s["status"] == "successful"]
+    unsuccessful = [t for t, s in status.items() if s["status"] != "successful"]
 
+    print(f"\nSuccessful ticker downloads: {len(successful)}")
+    print(f"Unsuccessful ticker downloads: {len(unsuccessful)}")
+    print(f"Total wall time: {total_secs:.1f}s")
+
+    ###
+    # Step: Optionally compact the small files that the child runs
+    #   committed, once all of them are done
+    ###
 
-    print(f"Successful ticker downloads: {len(successful_runs)}")
-    print(f"Unsuccessful ticker downloads: {len(unsuccessful_runs)}")
+    if compact_after and successful:
+        print("\nCompacting daily_ticker_data")
+        run = tower.run_app("compact-ticker-table")
+        run = tower.wait_for_run(run)
+        print(f"Compaction run: {run.status_group}")
 
 if __name__ == "__main__":
     main()
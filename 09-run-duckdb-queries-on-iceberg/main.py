@@ -1,26 +1,450 @@
 import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+
 import duckdb
+import pyarrow as pa
+import pyarrow.fs as pafs
+import pyarrow.parquet as pq
+import tower
+from pyiceberg.catalog import load_catalog
+
+from result_cache import ResultCache, analyze_query, cache_key
 
 IRC_CLIENT_ID = os.getenv("IRC_CLIENT_ID")
 IRC_CLIENT_SECRET = os.getenv("IRC_CLIENT_SECRET")
 IRC_ENDPOINT = os.getenv("IRC_ENDPOINT")
 
+CATALOG_ALIAS = "tower_demo_lakehouse"
+EXTENSIONS = ["httpfs", "iceberg"]
+
+# Rows per record batch read from DuckDB, and rows per insert into a Tower
+# table, so that no result is held in memory in full.
+BATCH_ROWS = 100_000
+ROWS_PER_COMMIT = 1_000_000
+
+QUERY_NAME = re.compile(r"^--\s*name:\s*(\w+)\s*$", re.MULTILINE)
+
+
+def connect(duckdb_dir: str) -> duckdb.DuckDBPyConnection:
+    """
+    Open the file-backed DuckDB database in duckdb_dir, with extensions
+    installed into duckdb_dir/extensions, so that they are downloaded once
+    and reused by later runs.
+    """
+    extension_dir = os.path.join(duckdb_dir, "extensions")
+    os.makedirs(extension_dir, exist_ok=True)
+
+    return duckdb.connect(
+        os.path.join(duckdb_dir, "session.duckdb"),
+        config={"extension_directory": extension_dir},
+    )
+
+
+def configure(con: duckdb.DuckDBPyConnection, threads: int, memory_limit: str):
+    """
+    Limit the worker threads and memory DuckDB uses. The limits are shared
+    by all queries running on cursors of the connection.
+
+    Args:
+        con: DuckDB connection
+        threads: Number of worker threads, 0 for DuckDB's default
+        memory_limit: Memory limit such as "4GB", empty for DuckDB's default
+    """
+    if threads > 0:
+        con.sql(f"SET threads = {threads};")
+    if memory_limit:
+        con.sql(f"SET memory_limit = '{memory_limit}';")
+
+
+def load_extensions(con: duckdb.DuckDBPyConnection, names: list[str]) -> list[str]:
+    """
+    Load the extensions, installing those that are not installed yet.
+
+    Returns:
+        The extensions that had to be installed
+    """
+    installed = {name for (name,) in con.sql(
+        "SELECT extension_name FROM duckdb_extensions() WHERE installed"
+    ).fetchall()}
+
+    missing = [name for name in names if name not in installed]
+    for name in missing:
+        con.sql(f"INSTALL {name};")
+    for name in names:
+        con.sql(f"LOAD {name};")
+
+    return missing
+
+
+def enable_metadata_cache(con: duckdb.DuckDBPyConnection, cache_dir: str):
+    """
+    Cache the files read over HTTP, such as Iceberg metadata files and
+    manifests, on disk in cache_dir, using the cache_httpfs community
+    extension. Warm runs then read them from disk instead of object storage.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+
+    try:
+        installed = con.sql(
+            "SELECT installed FROM duckdb_extensions() WHERE extension_name = 'cache_httpfs'"
+        ).fetchone()
+        if not installed or not installed[0]:
+            con.sql("INSTALL cache_httpfs FROM community;")
+        con.sql("LOAD cache_httpfs;")
+        con.sql("SET cache_httpfs_type = 'on_disk';")
+        con.sql(f"SET cache_httpfs_cache_directory = '{cache_dir}';")
+    except duckdb.Error as e:
+        print(f"Metadata cache not enabled: {e}")
+
+
+def attach_catalog(con: duckdb.DuckDBPyConnection, warehouse: str):
+    """
+    Attach the Iceberg catalog, unless this session has already attached it.
+    """
+    con.sql(f"ATTACH IF NOT EXISTS '{warehouse}' AS {CATALOG_ALIAS} (TYPE ICEBERG);")
+
+
+def parse_queries(text: str) -> dict[str, str]:
+    """
+    Split a SQL file into named queries. Every query starts with a
+    `-- name: <name>` line and runs until the next one.
+
+    Returns:
+        Dict of query name to SQL, in file order
+
+    Raises:
+        ValueError: If there are no queries, there is SQL before the first
+            name, a name is used twice, or a query is empty
+    """
+    parts = QUERY_NAME.split(text)
+
+    preamble = [line.strip() for line in parts[0].splitlines() if line.strip()]
+    if not all(line.startswith("--") for line in preamble):
+        raise ValueError("Queries file has SQL before the first '-- name:' line")
+
+    queries = {}
+    for name, sql in zip(parts[1::2], parts[2::2]):
+        if name in queries:
+            raise ValueError(f"Query '{name}' is defined twice")
+        if not sql.strip():
+            raise ValueError(f"Query '{name}' is empty")
+        queries[name] = sql.strip()
+
+    if not queries:
+        raise ValueError("Queries file has no '-- name:' lines")
+
+    return queries
+
+
+def write_parquet(reader: pa.RecordBatchReader, path: str) -> int:
+    """
+    Write the record batches to a Parquet file, one batch at a time. The
+    path can be local or a URI that pyarrow supports, such as s3://.
+
+    Returns:
+        The number of rows written
+    """
+    rows = 0
+    with pq.ParquetWriter(path, reader.schema) as writer:
+        for batch in reader:
+            writer.write_batch(batch)
+            rows += batch.num_rows
+    return rows
+
+
+def write_tower_table(reader: pa.RecordBatchReader, name: str, namespace: str) -> int:
+    """
+    Append the record batches to a Tower table, creating it if it does not
+    exist. Batches are inserted ROWS_PER_COMMIT rows at a time, so large
+    results take a few commits rather than one per batch.
+
+    Returns:
+        The number of rows written
+    """
+    table = tower.tables(name, namespace=namespace).create_if_not_exists(reader.schema)
+
+    rows = 0
+    pending = []
+    pending_rows = 0
+    for batch in reader:
+        pending.append(batch)
+        pending_rows += batch.num_rows
+        if pending_rows >= ROWS_PER_COMMIT:
+            table = table.insert(pa.Table.from_batches(pending, reader.schema))
+            rows += pending_rows
+            pending, pending_rows = [], 0
+
+    if pending_rows:
+        table = table.insert(pa.Table.from_batches(pending, reader.schema))
+        rows += pending_rows
+
+    return rows
+
+
+def load_rest_catalog(warehouse: str):
+    """
+    Load the Iceberg REST catalog with PyIceberg, to look up the current
+    snapshots of tables without going through DuckDB.
+    """
+    return load_catalog(
+        "tower",
+        type="rest",
+        uri=IRC_ENDPOINT,
+        credential=f"{IRC_CLIENT_ID}:{IRC_CLIENT_SECRET}",
+        warehouse=warehouse,
+    )
+
+
+def cache_keys(queries: dict[str, str], warehouse: str) -> dict[str, dict]:
+    """
+    Work out the result cache key of every query whose result can be cached.
+
+    The queries are parsed, without running them, for the catalog tables
+    they read. The current snapshot id of each of those tables is looked
+    up in the catalog, which does not read anything from object storage.
+
+    A table that cannot be looked up, e.g. because it does not exist, only
+    makes the queries that read it uncacheable. Those queries still run,
+    and report their own error.
+
+    Returns:
+        Dict of query name to its key, normalized SQL and snapshot ids
+    """
+    analyzed = {}
+    for name, sql in queries.items():
+        try:
+            analyzed[name] = analyze_query(sql, CATALOG_ALIAS)
+        except ValueError as e:
+            print(f"Not caching '{name}': {e}")
+
+    tables = {table for _, query_tables in analyzed.values() for table in query_tables}
+    if not tables:
+        return {}
+
+    try:
+        catalog = load_rest_catalog(warehouse)
+    except Exception as e:
+        print(f"Not caching any query: could not load the catalog: {e}")
+        return {}
+
+    def snapshot_id(table):
+        try:
+            return catalog.load_table(table).metadata.current_snapshot_id, None
+        except Exception as e:
+            return None, e
+
+    with ThreadPoolExecutor(max_workers=len(tables)) as executor:
+        lookups = dict(zip(tables, executor.map(snapshot_id, tables)))
+
+    keys = {}
+    for name, (normalized, query_tables) in analyzed.items():
+        failed = [table for table in query_tables if lookups[table][1] is not None]
+        if failed:
+            print(f"Not caching '{name}': could not look up {'.'.join(failed[0])}: {lookups[failed[0]][1]}")
+            continue
+
+        query_snapshot_ids = {".".join(table): lookups[table][0] for table in query_tables}
+        keys[name] = {
+            "key": cache_key(normalized, query_snapshot_ids),
+            "sql": normalized,
+            "snapshot_ids": query_snapshot_ids,
+        }
+
+    return keys
+
+
+def write_result(cursor: duckdb.DuckDBPyConnection, reader: pa.RecordBatchReader, name: str,
+                 output: str, output_dir: str, output_namespace: str) -> int:
+    """
+    Print the result of a query, or write it to Parquet or a Tower table.
+
+    Returns:
+        The number of rows in the result
+    """
+    if output == "print":
+        result = reader.read_all()
+        print(f"\n[{name}]")
+        cursor.from_arrow(result).show()
+        return result.num_rows
+    elif output == "parquet":
+        return write_parquet(reader, f"{output_dir}/{name}.parquet")
+    else:
+        return write_tower_table(reader, name, output_namespace)
+
+
+def run_query(con: duckdb.DuckDBPyConnection, name: str, sql: str, output: str,
+              output_dir: str, output_namespace: str, cache: ResultCache | None = None,
+              key: dict | None = None) -> dict:
+    """
+    Run one query on its own cursor and write its result.
+
+    Args:
+        con: DuckDB connection, whose cursor the query runs on
+        name: Query name, used as the file or table name of the result
+        sql: The query
+        output: "print", "parquet" or "tower"
+        output_dir: Directory for Parquet results
+        output_namespace: Namespace for Tower table results
+        cache: Result cache, or None to always run the query
+        key: The query's result cache key as returned by cache_keys(), or
+            None if its result cannot be cached
+
+    Returns:
+        Dict with the query's row count, planning and execution time,
+        whether its result was cached, and the error it failed with, if any
+    """
+    cursor = con.cursor()
+    stats = {"name": name, "rows": 0, "planning": 0.0, "execution": 0.0, "cache": "-", "error": None}
+
+    try:
+        if cache is not None and key is not None:
+            start = time.perf_counter()
+            reader = cache.get(key["key"])
+            if reader is not None:
+                stats["cache"] = "hit"
+                if output == "parquet":
+                    # The cached file already is the result
+                    pafs.copy_files(cache.path(key["key"]), f"{output_dir}/{name}.parquet")
+                    stats["rows"] = cache.entries[key["key"]]["rows"]
+                else:
+                    stats["rows"] = write_result(cursor, reader, name, output, output_dir, output_namespace)
+                stats["execution"] = time.perf_counter() - start
+                return stats
+            stats["cache"] = "miss"
+
+        # Planning binds the query, which loads the Iceberg metadata and
+        # manifests of the tables it reads. Execution reads the data files
+        # and writes the result.
+        start = time.perf_counter()
+        rel = cursor.sql(sql)
+        stats["planning"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        reader = rel.fetch_record_batch(BATCH_ROWS)
+        if stats["cache"] == "miss":
+            reader = cache.put(key["key"], reader, {"query": name, "sql": key["sql"], "snapshot_ids": key["snapshot_ids"]})
+        stats["rows"] = write_result(cursor, reader, name, output, output_dir, output_namespace)
+        stats["execution"] = time.perf_counter() - start
+    except Exception as e:
+        stats["error"] = e
+    finally:
+        cursor.close()
+
+    return stats
+
+
 def main():
-    # Setup DuckDB extensions for talking to Tower
-    duckdb.sql("LOAD iceberg;")
-    duckdb.sql("INSTALL httpfs;")
-    duckdb.sql("LOAD httpfs;")
+    duckdb_dir = os.path.expanduser(os.getenv("DUCKDB_DIR", "~/.cache/run-duckdb-queries-on-iceberg"))
+    warehouse = os.getenv("IRC_WAREHOUSE", "tower-demo-lakehouse")
+    metadata_cache = os.getenv("METADATA_CACHE", "true").lower() == "true"
+    query = os.getenv("QUERY", f"SELECT * FROM {CATALOG_ALIAS}.default.daily_ticker_data LIMIT 10;")
+    queries_file = os.getenv("QUERIES_FILE", "")
+    output = os.getenv("OUTPUT", "print").lower()
+    output_dir = os.getenv("OUTPUT_DIR", "./results")
+    output_namespace = os.getenv("OUTPUT_NAMESPACE", "reports")
+    concurrent_queries = int(os.getenv("CONCURRENT_QUERIES", "4"))
+    threads = int(os.getenv("THREADS", "0"))
+    memory_limit = os.getenv("MEMORY_LIMIT", "")
+    result_cache = os.getenv("RESULT_CACHE", "true").lower() == "true"
+    result_cache_max_mb = int(os.getenv("RESULT_CACHE_MAX_MB", "1024"))
+
+    if output not in ("print", "parquet", "tower"):
+        raise ValueError(f"OUTPUT must be print, parquet or tower, not '{output}'")
+
+    if queries_file:
+        with open(queries_file) as f:
+            queries = parse_queries(f.read())
+    else:
+        queries = {"query": query}
+
+    if output == "parquet" and "://" not in output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+
+    timings = {}
+    installed = []
+
+    # Look up the cached results of the queries. A cached result is only
+    # valid for the snapshots of the tables it was computed from, so the
+    # key includes their current snapshot ids.
+    cache = None
+    keys = {}
+    if result_cache:
+        start = time.perf_counter()
+        cache = ResultCache(os.path.join(duckdb_dir, "results"), result_cache_max_mb * 1024 * 1024)
+        keys = cache_keys(queries, warehouse)
+        timings["lookup"] = time.perf_counter() - start
 
-    # Setup the connection to the Iceberg catalog (passed in as secrets)
-    duckdb.sql(f"""CREATE SECRET (
+    to_run = [name for name in queries if name not in keys or not cache.contains(keys[name]["key"])]
+
+    if to_run:
+        # Setup DuckDB extensions for talking to Tower. They are installed into
+        # the pinned extension directory on the first run only.
+        start = time.perf_counter()
+        con = connect(duckdb_dir)
+        configure(con, threads, memory_limit)
+        installed = load_extensions(con, EXTENSIONS)
+        if metadata_cache:
+            enable_metadata_cache(con, os.path.join(duckdb_dir, "http_cache"))
+
+        # Setup the connection to the Iceberg catalog (passed in as secrets).
+        # The secret is kept in memory, so the credentials are not written to
+        # the database directory.
+        con.sql(f"""CREATE OR REPLACE SECRET tower_irc (
      TYPE ICEBERG,
      CLIENT_ID '{IRC_CLIENT_ID}',
      CLIENT_SECRET '{IRC_CLIENT_SECRET}',
      ENDPOINT '{IRC_ENDPOINT}'
 );""")
+        timings["setup"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        attach_catalog(con, warehouse)
+        timings["attach"] = time.perf_counter() - start
+    else:
+        # Every result is cached, so there is nothing to read from the
+        # catalog. An in-memory connection is enough to print the results.
+        con = duckdb.connect()
+
+    # Run the queries concurrently, each on its own cursor of the shared
+    # connection. The cursors share the attached catalog, the secret and
+    # DuckDB's thread and memory limits.
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrent_queries) as executor:
+        results = list(executor.map(
+            lambda item: run_query(con, item[0], item[1], output, output_dir, output_namespace,
+                                   cache, keys.get(item[0])),
+            queries.items(),
+        ))
+    timings["queries"] = time.perf_counter() - start
+
+    con.close()
+
+    if cache is not None:
+        cache.evict()
+        cache.save()
+
+    print(f"\nExtensions installed this run: {', '.join(installed) or 'none'}")
+    for phase, secs in timings.items():
+        print(f"{phase:<10} {secs:.3f}s")
+
+    print(f"\n{'Query':<30} {'Rows':>10} {'Cache':>6} {'Planning':>9} {'Execution':>10}")
+    for stats in results:
+        if stats["error"] is not None:
+            print(f"{stats['name']:<30} failed: {stats['error']}")
+        else:
+            print(f"{stats['name']:<30} {stats['rows']:>10} {stats['cache']:>6} "
+                  f"{stats['planning']:>8.3f}s {stats['execution']:>9.3f}s")
+
+    if cache is not None:
+        print(f"\nResult cache: {cache.hits} hits, {cache.misses} misses, "
+              f"{len(queries) - len(keys)} not cacheable, {cache.evictions} evicted, "
+              f"{cache.size() / 1024 / 1024:.1f} MB of {result_cache_max_mb} MB used")
 
-    duckdb.sql("ATTACH 'tower-demo-lakehouse' AS tower_demo_lakehouse (TYPE ICEBERG);")
-    duckdb.sql("SELECT * FROM tower_demo_lakehouse.default.daily_ticker_data LIMIT 10;").show()
+    failed = [stats["name"] for stats in results if stats["error"] is not None]
+    if failed:
+        raise RuntimeError(f"{len(failed)} of {len(results)} queries failed: {', '.join(failed)}")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,19 @@
+-- Example reports over the lakehouse. Every query starts with a
+-- "-- name:" line, which names its Parquet file or Tower table.
+
+-- name: latest_closes
+SELECT ticker, arg_max(close, date) AS close, max(date) AS date
+FROM tower_demo_lakehouse.default.daily_ticker_data
+GROUP BY ticker
+ORDER BY ticker;
+
+-- name: monthly_volume
+SELECT ticker, date_trunc('month', CAST(date AS DATE)) AS month, sum(volume) AS volume
+FROM tower_demo_lakehouse.default.daily_ticker_data
+GROUP BY ALL
+ORDER BY ticker, month;
+
+-- name: daily_returns
+SELECT ticker, CAST(date AS DATE) AS date, (close - open) / open AS intraday_return
+FROM tower_demo_lakehouse.default.daily_ticker_data
+ORDER BY ticker, date;
@@ -0,0 +1,237 @@
+"""
+Result cache for run-duckdb-queries-on-iceberg.
+
+Query results are stored as Parquet files in a local directory, keyed on the
+normalized SQL of the query and the current snapshot ids of the Iceberg
+tables it reads. As long as none of those tables gets a new snapshot, the
+query returns the same rows, so a cached result can be served from local
+disk without reading the tables from object storage.
+
+Only queries whose result depends on nothing but the catalog tables they
+read are cached: a single SELECT that reads at least one catalog table, no
+other tables or table functions such as read_parquet, and no functions such
+as random() or now() that return something different on every run.
+
+The cache is bounded in size. When it grows past its limit, the least
+recently used results are evicted.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+
+import duckdb
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+
+VOLATILE_FUNCTIONS = {
+    "random", "setseed", "uuid", "gen_random_uuid", "nextval", "currval",
+    "now", "today", "current_date", "current_time", "current_timestamp",
+    "current_localtime", "current_localtimestamp", "get_current_time",
+    "get_current_timestamp", "transaction_timestamp",
+}
+
+
+def walk(tree):
+    """
+    Yield every dict in a parsed JSON tree.
+    """
+    if isinstance(tree, dict):
+        yield tree
+        for value in tree.values():
+            yield from walk(value)
+    elif isinstance(tree, list):
+        for value in tree:
+            yield from walk(value)
+
+
+def analyze_query(sql: str, catalog_alias: str) -> tuple[str, list[tuple[str, str]]]:
+    """
+    Parse a query with DuckDB's parser, without running or binding it.
+
+    Args:
+        sql: The query
+        catalog_alias: Name the Iceberg catalog is attached as
+
+    Returns:
+        The query in DuckDB's normalized form, and the (namespace, table)
+        of every catalog table it reads, sorted
+
+    Raises:
+        ValueError: If the result of the query cannot be cached
+    """
+    con = duckdb.connect()
+    tree = json.loads(con.execute("SELECT json_serialize_sql(?)", [sql]).fetchone()[0])
+
+    if tree["error"]:
+        raise ValueError(tree["error_message"])
+    if len(tree["statements"]) != 1:
+        raise ValueError("it has more than one statement")
+
+    normalized = con.execute("SELECT json_deserialize_sql(json_serialize_sql(?))", [sql]).fetchone()[0]
+    con.close()
+
+    nodes = list(walk(tree))
+    ctes = {cte["key"] for node in nodes if "cte_map" in node for cte in node["cte_map"]["map"]}
+
+    tables = set()
+    for node in nodes:
+        node_type = node.get("type")
+
+        if node_type == "TABLE_FUNCTION":
+            raise ValueError(f"it reads {node['function']['function_name']}()")
+        if node_type == "FUNCTION" and node["function_name"].lower() in VOLATILE_FUNCTIONS:
+            raise ValueError(f"it calls {node['function_name']}()")
+        if node_type == "COLUMN_REF" and node["column_names"][-1].lower() in VOLATILE_FUNCTIONS:
+            raise ValueError(f"it uses {node['column_names'][-1]}")
+        if node.get("sample") is not None:
+            raise ValueError("it samples rows")
+
+        if node_type == "BASE_TABLE":
+            if node["catalog_name"] == catalog_alias and node["schema_name"]:
+                tables.add((node["schema_name"], node["table_name"]))
+            elif not node["catalog_name"] and not node["schema_name"] and node["table_name"] in ctes:
+                continue
+            else:
+                name = ".".join(part for part in (node["catalog_name"], node["schema_name"], node["table_name"]) if part)
+                raise ValueError(f"it reads {name}, which is not a table in {catalog_alias}")
+
+    if not tables:
+        raise ValueError(f"it reads no table in {catalog_alias}")
+
+    return normalized, sorted(tables)
+
+
+def cache_key(normalized_sql: str, snapshot_ids: dict[str, int | None]) -> str:
+    """
+    Key of a query result: a hash of the normalized SQL and the snapshot ids
+    of the tables the query reads.
+    """
+    payload = json.dumps([normalized_sql, sorted(snapshot_ids.items())])
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class ResultCache:
+    """
+    Query results stored as Parquet files in cache_dir, with an index of
+    their sizes and last use in cache_dir/index.json. Lookups and stores
+    are thread-safe; evict() and save() are called once the queries are
+    done.
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int):
+        self.cache_dir = cache_dir
+        self.index_path = os.path.join(cache_dir, "index.json")
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        os.makedirs(cache_dir, exist_ok=True)
+
+        self.entries = {}
+        if os.path.exists(self.index_path):
+            with open(self.index_path) as f:
+                self.entries = json.load(f)
+
+        # Results whose file is gone cannot be served
+        self.entries = {key: entry for key, entry in self.entries.items() if os.path.exists(self.path(key))}
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.parquet")
+
+    def contains(self, key: str) -> bool:
+        with self.lock:
+            return key in self.entries
+
+    def get(self, key: str) -> pa.RecordBatchReader | None:
+        """
+        Look up a result and count the hit or miss.
+
+        Returns:
+            Reader over the cached result, or None if it is not cached
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            entry["hits"] += 1
+            entry["last_used_at"] = time.time()
+
+        return self.read(key)
+
+    def read(self, key: str) -> pa.RecordBatchReader:
+        parquet_file = pq.ParquetFile(self.path(key))
+        return pa.RecordBatchReader.from_batches(parquet_file.schema_arrow, parquet_file.iter_batches())
+
+    def put(self, key: str, reader: pa.RecordBatchReader, description: dict) -> pa.RecordBatchReader:
+        """
+        Store a result, one record batch at a time.
+
+        Args:
+            key: Key of the result
+            reader: The result
+            description: What the result is, e.g. its SQL and snapshot ids,
+                kept in the index
+
+        Returns:
+            Reader over the stored result
+        """
+        path = self.path(key)
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+
+        rows = 0
+        try:
+            with pq.ParquetWriter(temp_path, reader.schema) as writer:
+                for batch in reader:
+                    writer.write_batch(batch)
+                    rows += batch.num_rows
+            os.replace(temp_path, path)
+        except Exception:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+        with self.lock:
+            now = time.time()
+            self.entries[key] = {
+                **description,
+                "rows": rows,
+                "bytes": os.path.getsize(path),
+                "created_at": now,
+                "last_used_at": now,
+                "hits": 0,
+            }
+
+        return self.read(key)
+
+    def size(self) -> int:
+        return sum(entry["bytes"] for entry in self.entries.values())
+
+    def evict(self):
+        """
+        Remove the least recently used results until the cache fits in
+        max_bytes.
+        """
+        total = self.size()
+        for key, entry in sorted(self.entries.items(), key=lambda item: item[1]["last_used_at"]):
+            if total <= self.max_bytes:
+                break
+            os.remove(self.path(key))
+            del self.entries[key]
+            total -= entry["bytes"]
+            self.evictions += 1
+
+    def save(self):
+        temp_path = f"{self.index_path}.tmp"
+        with open(temp_path, "w") as f:
+            json.dump(self.entries, f, indent=2)
+        os.replace(temp_path, self.index_path)
@@ -1,27 +1,175 @@
 import tower
 import polars as pl
-from datetime import datetime, timedelta
+from datetime import date
 import pyarrow as pa
 import pyarrow.compute as pc
 import os
 
+from pyiceberg.catalog import load_catalog
 
 
-def calculate_cutoff_date(df: pl.LazyFrame, time_window_days: int) -> str:
+CATALOG_NAME = "default"
+TABLE_IDENTIFIER = ("default", "daily_ticker_data")
+
+
+def file_stats(iceberg_table) -> pl.DataFrame:
+    """
+    Read the per-file statistics of the table from its manifests, without
+    reading any data files.
+
+    Args:
+        iceberg_table: PyIceberg table
+
+    Returns:
+        DataFrame with one row per data file: file_path, record_count,
+        file_size_in_bytes and the lower and upper bounds of ticker and date
+    """
+    files = pl.from_arrow(iceberg_table.inspect.data_files())
+    metrics = pl.col("readable_metrics")
+
+    return files.select(
+        "file_path",
+        "record_count",
+        "file_size_in_bytes",
+        metrics.struct.field("ticker").struct.field("lower_bound").alias("ticker_min"),
+        metrics.struct.field("ticker").struct.field("upper_bound").alias("ticker_max"),
+        metrics.struct.field("date").struct.field("lower_bound").alias("date_min"),
+        metrics.struct.field("date").struct.field("upper_bound").alias("date_max"),
+    )
+
+
+def retention_cutoffs(ticker_stats: pl.DataFrame, max_date: date, time_window_days: int,
+                      per_ticker: bool, align_to_month: bool) -> pl.DataFrame:
     """
-    Calculate the cutoff date for trimming the table.
-    
+    Calculate the cutoff date of every ticker. Rows before the cutoff are
+    deleted.
+
     Args:
-        df: Polars LazyFrame containing the data
+        ticker_stats: DataFrame with ticker and latest_date
+        max_date: The latest date in the table
         time_window_days: Number of days of data to keep
-        
+        per_ticker: Keep time_window_days relative to the latest date of each
+            ticker rather than the latest date in the table
+        align_to_month: Move the cutoffs back to the first day of their month,
+            so that only whole month partitions are deleted
+
+    Returns:
+        DataFrame with ticker and cutoff
+    """
+    latest_date = pl.col("latest_date") if per_ticker else pl.lit(max_date)
+    cutoff = latest_date - pl.duration(days=time_window_days)
+    if align_to_month:
+        cutoff = cutoff.dt.month_start()
+
+    return ticker_stats.select("ticker", cutoff.alias("cutoff"))
+
+
+def delete_filter(cutoffs: pl.DataFrame) -> str:
+    """
+    Build the delete predicate for the cutoffs. Tickers that share a cutoff
+    are grouped into one IN clause to keep the predicate short.
+
+    Args:
+        cutoffs: DataFrame with ticker and cutoff
+
+    Returns:
+        Predicate string for table.delete
+    """
+    groups = cutoffs.group_by("cutoff").agg(pl.col("ticker").sort()).sort("cutoff")
+
+    if groups.height == 1:
+        return f"date < '{groups['cutoff'][0]:%Y-%m-%d}'"
+
+    clauses = []
+    for cutoff, tickers in groups.iter_rows():
+        ticker_list = ", ".join(f"'{ticker}'" for ticker in tickers)
+        clauses.append(f"(ticker IN ({ticker_list}) AND date < '{cutoff:%Y-%m-%d}')")
+    return " OR ".join(clauses)
+
+
+def plan_delete(files: pl.DataFrame, cutoffs: pl.DataFrame, per_ticker: bool) -> pl.DataFrame:
+    """
+    Work out from the file statistics what the delete does to each data file.
+
+    A file is dropped without being read when all of its rows are before the
+    cutoff. With per-ticker cutoffs that is only known for files of a single
+    ticker. A file is rewritten when some of its rows might be before the
+    cutoff, and kept otherwise.
+
+    Args:
+        files: Output of file_stats
+        cutoffs: DataFrame with ticker and cutoff
+        per_ticker: Whether the cutoffs differ per ticker
+
+    Returns:
+        files with an action column: "drop", "rewrite" or "keep"
+    """
+    # Tickers that share one cutoff delete like a single date predicate
+    if per_ticker and cutoffs["cutoff"].n_unique() > 1:
+        file_cutoffs = files.select("file_path", "ticker_min", "ticker_max").join(
+            cutoffs, how="cross"
+        ).filter(
+            pl.col("ticker").is_between(pl.col("ticker_min"), pl.col("ticker_max"))
+        ).group_by("file_path").agg(
+            pl.col("cutoff").min().alias("min_cutoff"),
+            pl.col("cutoff").max().alias("max_cutoff"),
+        )
+        files = files.join(file_cutoffs, on="file_path", how="left")
+        can_drop = pl.col("ticker_min") == pl.col("ticker_max")
+    else:
+        cutoff = cutoffs["cutoff"].max()
+        files = files.with_columns(
+            pl.lit(cutoff).alias("min_cutoff"),
+            pl.lit(cutoff).alias("max_cutoff"),
+        )
+        can_drop = pl.lit(True)
+
+    return files.with_columns(
+        pl.when(can_drop & (pl.col("date_max") < pl.col("min_cutoff")))
+        .then(pl.lit("drop"))
+        .when(pl.col("date_min") < pl.col("max_cutoff"))
+        .then(pl.lit("rewrite"))
+        .otherwise(pl.lit("keep"))
+        .alias("action")
+    ).drop("min_cutoff", "max_cutoff")
+
+
+def delete_changes(iceberg_table, since_snapshot_id: int) -> dict:
+    """
+    Sum up the changes of the snapshots committed after since_snapshot_id.
+    PyIceberg commits files that are dropped whole in a delete snapshot and
+    files that are rewritten in an overwrite snapshot.
+
+    Args:
+        iceberg_table: PyIceberg table
+        since_snapshot_id: Current snapshot before the delete
+
     Returns:
-        String representation of the cutoff date in YYYY-MM-DD format
+        Dict with files_dropped, files_rewritten, bytes_read and bytes_written
     """
-    # Handle both date formats: "YYYY-MM-DD" and "YYYY-MM-DD HH:MM:SS"
-    max_date = df.select(pl.col("date").str.slice(0, 10).str.to_date().max()).collect().item()
-    cutoff_date = max_date - timedelta(days=time_window_days)
-    return cutoff_date.strftime("%Y-%m-%d")
+    changes = {"files_dropped": 0, "files_rewritten": 0, "bytes_read": 0, "bytes_written": 0}
+
+    snapshot = iceberg_table.current_snapshot()
+    while snapshot is not None and snapshot.snapshot_id != since_snapshot_id:
+        summary = snapshot.summary
+        deleted_files = int(summary.get("deleted-data-files") or 0)
+        if summary.operation.value == "delete":
+            changes["files_dropped"] += deleted_files
+        else:
+            changes["files_rewritten"] += deleted_files
+            changes["bytes_read"] += int(summary.get("removed-files-size") or 0)
+            changes["bytes_written"] += int(summary.get("added-files-size") or 0)
+        snapshot = iceberg_table.snapshot_by_id(snapshot.parent_snapshot_id) if snapshot.parent_snapshot_id else None
+
+    return changes
+
+
+def print_plan(plan: pl.DataFrame):
+    for action, label in [("drop", "Files to drop"), ("rewrite", "Files to rewrite")]:
+        selected = plan.filter(pl.col("action") == action)
+        print(f"{label}: {selected.height} "
+              f"({selected['record_count'].sum()} rows, {selected['file_size_in_bytes'].sum() / 1024 / 1024:.1f} MB)")
+
 
 def main():
     """
@@ -30,46 +178,105 @@ def main():
 
     time_window_days_str = os.getenv("TIME_WINDOW_DAYS", "31")
     time_window_days = int(time_window_days_str)
+    dry_run = os.getenv("DRY_RUN", "false").lower() == "true"
+    trim_mode = os.getenv("TRIM_MODE", "exact").lower()
+    per_ticker = os.getenv("RETENTION_PER_TICKER", "false").lower() == "true"
+
+    if trim_mode not in ("exact", "partition"):
+        print(f"Unknown TRIM_MODE '{trim_mode}', expected 'exact' or 'partition'")
+        return
 
     ###
     # Step 1: Get a reference to the table in Tower.
-    #   We will use it for reads and writes.
+    #   We will use it for reads and writes. We also load the table with
+    #   PyIceberg to read the file statistics in its manifests.
     ###
 
     table = tower.tables("daily_ticker_data").load()
-
+    iceberg_table = load_catalog(CATALOG_NAME).load_table(TABLE_IDENTIFIER)
 
     ###
-    # Step 2: Get a LazyFrame of the data in the table. 
-    #   Don't load it yet to memory.
+    # Step 2: Read the file statistics. These tell us what the delete does
+    #   to each file, without scanning any rows.
     ###
 
-    df = table.to_polars()
+    files = file_stats(iceberg_table)
+
+    if files.is_empty():
+        print("\nTable 'daily_ticker_data' has no data, nothing to trim")
+        return
 
     ###
-    # Step 3: Calculate stats per ticker before trimming the table
+    # Step 3: Calculate stats per ticker before trimming the table, with
+    #   one scan of the ticker and date columns. Data files hold many
+    #   tickers, as written by batched runs or compaction, so the file
+    #   statistics cannot give per-ticker counts.
     ###
 
-    ticker_stats = df.group_by("ticker").agg([
+    ticker_stats = table.to_polars().group_by("ticker").agg([
         pl.len().alias("row_count"),
-        pl.col("date").str.slice(0, 10).str.to_date().max().alias("latest_date")
-    ]).collect()    
+        pl.col("date").max().alias("latest_date")
+    ]).sort("ticker").collect()
 
     # Print the stats with a descriptive header
     print("\nTicker Statistics Before Trimming:")
     print(ticker_stats)
 
     ###
-    # Step 4: Trim the table: remove all records older than the time window
+    # Step 4: Work out the cutoff dates and what the delete does to each
+    #   data file. In "partition" mode the cutoffs move back to the start
+    #   of their month. Files never span two month partitions, so every
+    #   file is then either dropped whole or kept, and nothing is rewritten.
     ###
 
-    cutoff_date_str = calculate_cutoff_date(df, time_window_days)
+    max_date = ticker_stats["latest_date"].max()
+
+    align_to_month = trim_mode == "partition"
+    if align_to_month and "date_month" not in {field.name for field in iceberg_table.spec().fields}:
+        print("\nTable is not partitioned by month, files that straddle the cutoff will be rewritten. "
+              "Migrate the table with the write-ticker-data-to-iceberg app (MIGRATE_TABLE=true).")
+
+    cutoffs = retention_cutoffs(ticker_stats, max_date, time_window_days, per_ticker, align_to_month)
+    plan = plan_delete(files, cutoffs, per_ticker)
+    predicate = delete_filter(cutoffs)
+
+    if per_ticker:
+        print(f"\nCutoff dates: {cutoffs['cutoff'].min()} to {cutoffs['cutoff'].max()} "
+              f"({time_window_days} days per ticker)")
+    else:
+        print(f"\nCutoff date: {cutoffs['cutoff'].max()}")
+    print_plan(plan)
+
+    if dry_run:
+        print("\nDry run, nothing was deleted")
+        return
+
+    if plan.filter(pl.col("action") != "keep").is_empty():
+        print("\nNo rows before the cutoff, nothing to delete")
+        return
+
+    ###
+    # Step 5: Trim the table: remove all records before the cutoff. Files
+    #   whose rows all match the predicate are dropped without being read,
+    #   only files that straddle the cutoff are rewritten.
+    ###
+
+    snapshot_id = iceberg_table.current_snapshot().snapshot_id
+    table.delete(predicate)
+
+    ###
+    # Step 6: Report what the delete actually did, from the summaries of
+    #   the snapshots it committed
+    ###
 
-    # Delete records older than the cutoff date
-    table.delete(f"date < '{cutoff_date_str}'")
+    iceberg_table = load_catalog(CATALOG_NAME).load_table(TABLE_IDENTIFIER)
+    changes = delete_changes(iceberg_table, snapshot_id)
 
-    # Print confirmation
-    print(f"\nDeleted records older than {cutoff_date_str}")
+    print("\nDeleted records before the cutoff")
+    print(f"Files dropped: {changes['files_dropped']}")
+    print(f"Files rewritten: {changes['files_rewritten']}")
+    print(f"Bytes rewritten: {changes['bytes_read'] / 1024 / 1024:.1f} MB read, "
+          f"{changes['bytes_written'] / 1024 / 1024:.1f} MB written")
 
 
 if __name__ == "__main__":
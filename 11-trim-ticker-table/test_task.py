@@ -0,0 +1,62 @@
+from pyiceberg.table.snapshots import Operation, Snapshot, Summary
+
+from task import delete_changes
+
+
+class SnapshotHistory:
+    """
+    Stands in for a PyIceberg table with a chain of snapshots.
+    """
+
+    def __init__(self, snapshots):
+        self.snapshots = {snapshot.snapshot_id: snapshot for snapshot in snapshots}
+        self.current_id = snapshots[-1].snapshot_id
+
+    def current_snapshot(self):
+        return self.snapshots[self.current_id]
+
+    def snapshot_by_id(self, snapshot_id):
+        return self.snapshots.get(snapshot_id)
+
+
+def snapshot(snapshot_id, parent_id, summary):
+    return Snapshot(
+        snapshot_id=snapshot_id,
+        parent_snapshot_id=parent_id,
+        sequence_number=snapshot_id,
+        timestamp_ms=snapshot_id,
+        manifest_list=f"snap-{snapshot_id}.avro",
+        summary=summary,
+    )
+
+
+def test_delete_changes_without_added_files():
+    # An overwrite whose rewritten file ended up fully deleted adds no files,
+    # so its summary has no added-files keys
+    table = SnapshotHistory([
+        snapshot(1, None, Summary(Operation.APPEND, **{"added-data-files": "3"})),
+        snapshot(2, 1, Summary(Operation.DELETE, **{"deleted-data-files": "2"})),
+        snapshot(3, 2, Summary(Operation.OVERWRITE, **{"deleted-data-files": "1", "removed-files-size": "2048"})),
+    ])
+
+    assert delete_changes(table, since_snapshot_id=1) == {
+        "files_dropped": 2,
+        "files_rewritten": 1,
+        "bytes_read": 2048,
+        "bytes_written": 0,
+    }
+
+
+def test_delete_changes_with_empty_summaries():
+    table = SnapshotHistory([
+        snapshot(1, None, Summary(Operation.APPEND)),
+        snapshot(2, 1, Summary(Operation.DELETE)),
+        snapshot(3, 2, Summary(Operation.OVERWRITE)),
+    ])
+
+    assert delete_changes(table, since_snapshot_id=1) == {
+        "files_dropped": 0,
+        "files_rewritten": 0,
+        "bytes_read": 0,
+        "bytes_written": 0,
+    }
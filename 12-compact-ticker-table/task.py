@@ -0,0 +1,184 @@
+import polars as pl
+from datetime import date, datetime, timedelta, timezone
+import os
+import time
+
+from pyiceberg.catalog import load_catalog
+from pyiceberg.expressions import And, GreaterThanOrEqual, LessThan
+
+
+CATALOG_NAME = "default"
+TABLE_IDENTIFIER = ("default", "daily_ticker_data")
+TARGET_FILE_SIZE_PROPERTY = "write.target-file-size-bytes"
+
+
+def month_range(month: int) -> tuple[date, date]:
+    """
+    Convert a month(date) partition value into a date range.
+
+    Args:
+        month: Number of months since 1970-01
+
+    Returns:
+        The first day of the month and the first day of the next month
+    """
+    start = date(1970 + month // 12, month % 12 + 1, 1)
+    end = date(1970 + (month + 1) // 12, (month + 1) % 12 + 1, 1)
+    return start, end
+
+
+def file_stats(table) -> pl.DataFrame:
+    """
+    List the data files of the current snapshot with their size, row count
+    and month partition.
+
+    Args:
+        table: The PyIceberg table
+
+    Returns:
+        DataFrame with file_path, file_size_in_bytes, record_count and date_month
+    """
+    files = pl.from_arrow(table.inspect.data_files())
+
+    if files.is_empty() or "date_month" not in files.schema["partition"].to_schema():
+        month = pl.lit(None, dtype=pl.Int32)
+    else:
+        month = pl.col("partition").struct.field("date_month")
+
+    return files.select(
+        "file_path",
+        "file_size_in_bytes",
+        "record_count",
+        month.alias("date_month"),
+    )
+
+
+def time_scan(table) -> float:
+    """
+    Time a scan of the ticker and date columns, which is dominated by
+    planning and opening files.
+
+    Args:
+        table: The PyIceberg table
+
+    Returns:
+        Scan time in seconds
+    """
+    start = time.perf_counter()
+    table.scan(selected_fields=("ticker", "date")).to_arrow()
+    return time.perf_counter() - start
+
+
+def print_stats(label: str, files: pl.DataFrame, scan_secs: float, num_snapshots: int):
+    print(f"\n{label}:")
+    print(f"  Data files: {files.height}")
+    print(f"  Total size: {files['file_size_in_bytes'].sum() / 1024 / 1024:.1f} MB")
+    print(f"  Snapshots:  {num_snapshots}")
+    print(f"  Scan time:  {scan_secs:.2f}s")
+
+
+def main():
+    """
+    Rewrite small files of the ticker table into target-sized files and
+    expire old snapshots
+    """
+
+    target_file_size_mb = int(os.getenv("TARGET_FILE_SIZE_MB", "128"))
+    min_files_to_compact = int(os.getenv("MIN_FILES_TO_COMPACT", "2"))
+    snapshot_retention_hours = int(os.getenv("SNAPSHOT_RETENTION_HOURS", "24"))
+    dry_run = os.getenv("DRY_RUN", "false").lower() == "true"
+
+    target_file_size = target_file_size_mb * 1024 * 1024
+
+    ###
+    # Step 1: Get a reference to the table. We use PyIceberg directly,
+    #   because compaction needs the table's file listing.
+    ###
+
+    catalog = load_catalog(CATALOG_NAME)
+    table = catalog.load_table(TABLE_IDENTIFIER)
+
+    ###
+    # Step 2: Collect file stats before compacting
+    ###
+
+    files = file_stats(table)
+    print_stats("Before compaction", files, time_scan(table), len(table.metadata.snapshots))
+
+    ###
+    # Step 3: Find the month partitions with enough small files to be
+    #   worth rewriting
+    ###
+
+    if files["date_month"].null_count() > 0:
+        print("\nSkipping files that are not partitioned by month. "
+              "Migrate the table with the write-ticker-data-to-iceberg app (MIGRATE_TABLE=true).")
+
+    candidates = files.filter(
+        pl.col("date_month").is_not_null()
+        & (pl.col("file_size_in_bytes") < target_file_size * 0.75)
+    ).group_by("date_month").agg(
+        pl.len().alias("small_files"),
+        pl.col("file_size_in_bytes").sum().alias("bytes"),
+    ).filter(
+        pl.col("small_files") >= min_files_to_compact
+    ).sort("date_month")
+
+    print(f"\nPartitions to compact: {candidates.height}")
+    for row in candidates.iter_rows(named=True):
+        start, _ = month_range(row["date_month"])
+        print(f"  {start:%Y-%m}: {row['small_files']} small files, {row['bytes'] / 1024 / 1024:.1f} MB")
+
+    if dry_run:
+        print("\nDry run, nothing was changed")
+        return
+
+    ###
+    # Step 4: Rewrite each partition into target-sized files. All
+    #   partitions are rewritten in one transaction, which is committed to
+    #   the catalog at once, so readers see either none or all of the
+    #   rewritten partitions. Each overwrite still adds a delete and an
+    #   append snapshot to the table history. The overwrite filters line
+    #   up with the month partitions, so the old files are dropped without
+    #   being rewritten.
+    ###
+
+    if not candidates.is_empty():
+        with table.transaction() as tx:
+            # The target file size only applies to this rewrite. The
+            # previous value is restored before the transaction commits,
+            # so later writers keep the table's own setting.
+            previous_target = table.properties.get(TARGET_FILE_SIZE_PROPERTY)
+            tx.set_properties(**{TARGET_FILE_SIZE_PROPERTY: str(target_file_size)})
+
+            for month in candidates["date_month"]:
+                start, end = month_range(month)
+                row_filter = And(
+                    GreaterThanOrEqual("date", start.isoformat()),
+                    LessThan("date", end.isoformat()),
+                )
+                data = table.scan(row_filter=row_filter).to_arrow()
+                tx.overwrite(data, overwrite_filter=row_filter)
+
+            if previous_target is None:
+                tx.remove_properties(TARGET_FILE_SIZE_PROPERTY)
+            else:
+                tx.set_properties(**{TARGET_FILE_SIZE_PROPERTY: previous_target})
+
+    ###
+    # Step 5: Expire snapshots older than the retention period, so that
+    #   the table metadata does not keep growing with every commit
+    ###
+
+    table = catalog.load_table(TABLE_IDENTIFIER)
+
+    if snapshot_retention_hours > 0:
+        expire_before = datetime.now(timezone.utc) - timedelta(hours=snapshot_retention_hours)
+        table.maintenance.expire_snapshots().older_than(expire_before).commit()
+        table = catalog.load_table(TABLE_IDENTIFIER)
+
+    print_stats("After compaction", file_stats(table), time_scan(table), len(table.metadata.snapshots))
+
+
+if __name__ == "__main__":
+    main()
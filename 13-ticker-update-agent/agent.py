@@ -1,6 +1,13 @@
 import tower
-import polars as pl
 import os
+import asyncio
+import threading
+import time
+from datetime import datetime
+
+from pyiceberg.catalog import load_catalog
+from pyiceberg.exceptions import NoSuchTableError
+from pyiceberg.expressions import EqualTo
 
 
 from langchain_core.tools import tool
@@ -10,6 +17,9 @@ from langchain.agents import create_openai_tools_agent, AgentExecutor
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 
 
+CATALOG_NAME = "default"
+TABLE_IDENTIFIER = ("default", "daily_ticker_data")
+
 
 def get_llm():
 
@@ -23,28 +33,86 @@ def get_llm():
         return ChatOpenAI(model=model_to_use, temperature=temperature)
 
 
+class TickerPriceCache:
+    """
+    Closing prices by pull date, read from the current snapshot of
+    daily_ticker_data.
+
+    The table is loaded once and all prices of a pull date are read in one
+    scan, so checking a ticker is a dict lookup. The cached prices belong to
+    one snapshot and are only read again when the table has a new snapshot,
+    which the agent checks with refresh() after it has written new data.
+    """
+
+    def __init__(self):
+        self.table = None
+        self.snapshot_id = None
+        self.prices = {}
+        self.scans = 0
+        # Tools can run concurrently, so only one of them reads the table
+        # at a time
+        self.lock = threading.Lock()
+
+    def load_table(self):
+        if self.table is None:
+            try:
+                self.table = load_catalog(CATALOG_NAME).load_table(TABLE_IDENTIFIER)
+            except NoSuchTableError:
+                print("Table 'daily_ticker_data' does not exist.")
+                return None
+        return self.table
+
+    def refresh(self):
+        """
+        Pick up new snapshots of the table, for example after a
+        write-ticker-data-to-iceberg run has committed.
+        """
+        with self.lock:
+            if self.table is None:
+                self.load_table()
+            else:
+                self.table.refresh()
+
+    def get(self, ticker: str, pull_date_str: str):
+        """
+        Gets the closing price of a ticker on a pull date.
+        Returns None if the table has no such row.
+        """
+        with self.lock:
+            table = self.load_table()
+            if table is None:
+                return None
+
+            snapshot = table.current_snapshot()
+            snapshot_id = snapshot.snapshot_id if snapshot else None
+            if snapshot_id != self.snapshot_id:
+                self.snapshot_id = snapshot_id
+                self.prices = {}
+
+            if pull_date_str not in self.prices:
+                # Dates are stored as dates, so the filter prunes the table's
+                # month partitions
+                pull_date = datetime.strptime(pull_date_str, "%Y-%m-%d").date()
+                rows = table.scan(
+                    row_filter=EqualTo("date", pull_date.isoformat()),
+                    selected_fields=("ticker", "close"),
+                ).to_arrow()
+                self.scans += 1
+                self.prices[pull_date_str] = dict(zip(rows["ticker"].to_pylist(), rows["close"].to_pylist()))
+                print(f"Read {rows.num_rows} prices for {pull_date_str} from snapshot {snapshot_id}")
+
+            return self.prices[pull_date_str].get(ticker)
+
+
+ticker_prices = TickerPriceCache()
+
+
 def get_ticker_price(TICKER: str, PULL_DATE: str):
     """
     Gets the price for a given ticker and pull date from the database.
     Returns the price value if matching rows are found, None otherwise.
     """
-    try:
-        table = tower.tables("daily_ticker_data").load()
-    except Exception:
-        print("Table 'daily_ticker_data' does not exist.")
-        return None
-        
-    df = table.to_polars()
-
-    # Filter for matching ticker and date
-    matching_rows = df.filter(
-        (pl.col("ticker") == TICKER) & (pl.col("date") == PULL_DATE)
-    ).collect()
-
-    if matching_rows.height > 0 and "close" in matching_rows.columns:
-        return matching_rows["close"][0]
-    else:
-        return None
+    return ticker_prices.get(TICKER, PULL_DATE)
 
 
 # Function to check if the data for the given ticker and pull date is already available
@@ -89,6 +157,8 @@ def fetch_and_store_data_for_ticker_into_database(PULL_DATE: str, TICKER: str) -
     fetched = run.status_group == "successful"
 
     if fetched:
+        # The run committed a new snapshot, which replaces the cached prices
+        ticker_prices.refresh()
         price = get_ticker_price(TICKER, PULL_DATE)
         retmsg = f"Data for {TICKER} has been FETCHED. Price of {TICKER} on {PULL_DATE} is {price}. Processing for {TICKER} is COMPLETE. Move to next."
     else:
@@ -96,9 +166,125 @@ def fetch_and_store_data_for_ticker_into_database(PULL_DATE: str, TICKER: str) -
 
     return retmsg
 
+def parse_tickers(TICKERS: str) -> list[str]:
+    return [ticker.strip() for ticker in TICKERS.split(",") if ticker.strip()]
+
+
+# Function to check the data of a list of tickers in one call
+@tool
+def check_if_tickers_data_is_already_available(PULL_DATE: str, TICKERS: str) -> str:
+    """
+    Checks for a comma-separated list of tickers which of them have data for the pull date in the database.
+    Returns the prices of the available tickers and the comma-separated list of MISSING tickers.
+    """
+
+    ticker_list = parse_tickers(TICKERS)
+    print(f"Checking if data is available for {len(ticker_list)} tickers on date {PULL_DATE}")
+
+    prices = {ticker: get_ticker_price(ticker, PULL_DATE) for ticker in ticker_list}
+    available = [f"{ticker}: {price}" for ticker, price in prices.items() if price is not None]
+    missing = [ticker for ticker, price in prices.items() if price is None]
+
+    retmsg = f"Prices on {PULL_DATE} ALREADY AVAILABLE: {', '.join(available) or 'none'}. "
+    if missing:
+        retmsg += f"MISSING tickers: {','.join(missing)}"
+    else:
+        retmsg += "No tickers are MISSING. Processing is COMPLETE."
+
+    return retmsg
+
+
+# Function to fetch and store the data of a list of tickers in one run
+@tool
+def fetch_and_store_data_for_tickers_into_database(PULL_DATE: str, TICKERS: str) -> str:
+    """
+    Fetches the prices of a comma-separated list of tickers from an External API and inserts them for the pull date into the database, with a single run for all tickers.
+    Returns the prices of the fetched tickers and the tickers that could not be fetched.
+    """
+
+    ticker_list = parse_tickers(TICKERS)
+    print(f"Fetching and storing data for {len(ticker_list)} tickers on date {PULL_DATE}")
+
+    app_params = {
+        "PULL_DATE": str(PULL_DATE),
+        "TICKERS": ",".join(ticker_list),
+    }
+
+    run = tower.run_app("write-ticker-data-to-iceberg", parameters=app_params)
+    run = tower.wait_for_run(run)
+
+    if run.status_group != "successful":
+        return f"Data for {','.join(ticker_list)} has NOT been FETCHED. Processing for these tickers is INCOMPLETE."
+
+    # The run committed a new snapshot, which replaces the cached prices
+    ticker_prices.refresh()
+    prices = {ticker: get_ticker_price(ticker, PULL_DATE) for ticker in ticker_list}
+    fetched = [f"{ticker}: {price}" for ticker, price in prices.items() if price is not None]
+    not_found = [ticker for ticker, price in prices.items() if price is None]
+
+    retmsg = f"Prices on {PULL_DATE} FETCHED: {', '.join(fetched) or 'none'}. "
+    if not_found:
+        retmsg += f"No data found for: {','.join(not_found)}. "
+    retmsg += "Processing is COMPLETE."
+
+    return retmsg
+
+def preplan(ticker_list: list[str], pull_date_str: str) -> tuple[dict, list[str]]:
+    """
+    Checks the availability of all tickers in plain Python, before the LLM
+    is involved.
+
+    Args:
+        ticker_list: Tickers of the request
+        pull_date_str: Date of stock data in YYYY-MM-DD format
+
+    Returns:
+        Dict of the available tickers to their price, and the list of
+        missing tickers
+    """
+    prices = {ticker: get_ticker_price(ticker, pull_date_str) for ticker in ticker_list}
+    available = {ticker: price for ticker, price in prices.items() if price is not None}
+    missing = [ticker for ticker, price in prices.items() if price is None]
+    return available, missing
+
+
 def main():
 
-    tools = [fetch_and_store_data_for_ticker_into_database, check_if_ticker_data_is_already_available]
+    start = time.perf_counter()
+    timings = {}
+
+    tickers, pull_date = os.getenv("TICKERS"), os.getenv("PULL_DATE")
+    use_preplan = os.getenv("PREPLAN", "false").lower() == "true"
+
+    ###
+    # Step 1 (optional): Check which tickers are already in the database
+    #   without the LLM. Only the missing tickers need its reasoning, and
+    #   if none are missing the LLM is not called at all.
+    ###
+
+    if use_preplan:
+        phase_start = time.perf_counter()
+        available, missing = preplan(parse_tickers(tickers), pull_date)
+        timings["preplan"] = time.perf_counter() - phase_start
+
+        print(f"Pre-planning: {len(available)} tickers available, {len(missing)} missing")
+        for ticker, price in available.items():
+            print(f"Price of {ticker} on {pull_date} is {price}")
+
+        if not missing:
+            timings["total"] = time.perf_counter() - start
+            print("All tickers processed")
+            print_timings(timings)
+            return timings
+
+        tickers = ",".join(missing)
+
+    tools = [
+        check_if_tickers_data_is_already_available,
+        fetch_and_store_data_for_tickers_into_database,
+        check_if_ticker_data_is_already_available,
+        fetch_and_store_data_for_ticker_into_database,
+    ]
     llm = get_llm()
     
     business_rules = """
@@ -108,9 +294,11 @@ def main():
         1. You can get stock ticker price either from a database or fetch it from an external source.
         2. Getting from the database is preferred because it saves time.
         3. When you fetch from an external source, you also save it in the database and can use the result later.
-        4. When you receive a list of tickers, determine the stock price one ticker after another.
-        5. Once you have checked (and optionally fetched) EVERY ticker in the list, you MUST respond with "All tickers processed".
-        6. Once you are done, you MUST respond with a summary of the prices of all the tickers.
+        4. When you receive a list of tickers, check the WHOLE list with one call to check_if_tickers_data_is_already_available.
+        5. Then fetch ALL the MISSING tickers with one call to fetch_and_store_data_for_tickers_into_database. Do not fetch tickers that are already available.
+        6. Only use the single-ticker tools when you need to handle one ticker on its own. You can call tools for several tickers at the same time, and they run in parallel.
+        7. Once you have checked (and optionally fetched) EVERY ticker in the list, you MUST respond with "All tickers processed".
+        8. Once you are done, you MUST respond with a summary of the prices of all the tickers.
         """
 
     system_prompt = """
@@ -139,13 +327,31 @@ def main():
     user_input = os.getenv("USER_INPUT")
     user_input = user_input + "\n\n" + business_rules
 
-    tickers, pull_date = os.getenv("TICKERS"), os.getenv("PULL_DATE")
     full_input = f"{user_input}\n\nTickers: {tickers}\nPull Date: {pull_date}"
- 
-    # Invoke the agent
-    response = executor.invoke({"input": full_input})
+    if use_preplan:
+        full_input += "\nThese tickers were already checked and are MISSING from the database. Fetch them, there is no need to check them again."
+
+    ###
+    # Step 2: Invoke the agent. The async executor runs the tool calls of
+    #   one LLM response concurrently, so the child runs of several
+    #   missing tickers are in flight at the same time.
+    ###
+
+    phase_start = time.perf_counter()
+    response = asyncio.run(executor.ainvoke({"input": full_input}))
+    timings["agent"] = time.perf_counter() - phase_start
     print(response)
 
+    timings["total"] = time.perf_counter() - start
+    print_timings(timings)
+    return timings
+
+
+def print_timings(timings: dict):
+    print("\nLatency:")
+    for phase, secs in timings.items():
+        print(f"  {phase:<8} {secs:.2f}s")
+
 if __name__ == "__main__":
     main()
 
@@ -0,0 +1,164 @@
+"""
+Offline latency benchmark for the ticker update agent.
+
+Runs `agent.main()` for ticker lists of several sizes against:
+
+- the stub inference server in `stub_llm_server.py`, with a fixed latency
+  per LLM response,
+- a local Iceberg catalog in a temporary directory, with a month-partitioned
+  daily_ticker_data table, of which a fraction of the tickers is already
+  filled in,
+- simulated write-ticker-data-to-iceberg runs, which take a fixed time and
+  then append random prices for their tickers.
+
+For every size it reports the LLM round-trips, tool calls, child runs,
+table scans and the wall time of each phase of the agent.
+
+Usage:
+
+    BENCH_SIZES=5,20,50 BENCH_POLICY=batch PREPLAN=true uv run python benchmark.py
+"""
+
+import contextlib
+import io
+import os
+import random
+import tempfile
+import threading
+import time
+from datetime import date
+from types import SimpleNamespace
+
+import pyarrow as pa
+from pyiceberg.catalog import load_catalog
+from pyiceberg.transforms import MonthTransform
+
+import agent
+from stub_llm_server import StubLLM, start_server
+
+
+SCHEMA = pa.schema([
+    ("ticker", pa.string()),
+    ("date", pa.date32()),
+    ("open", pa.float64()),
+    ("close", pa.float64()),
+    ("volume", pa.int64()),
+])
+
+TABLE_IDENTIFIER = ("default", "daily_ticker_data")
+
+
+def local_catalog():
+    """
+    Create a SQLite catalog in a temporary directory, so the benchmark does
+    not touch a real table.
+    """
+    warehouse = tempfile.mkdtemp(prefix="ticker-agent-bench-")
+    catalog = load_catalog(
+        "default",
+        type="sql",
+        uri=f"sqlite:///{warehouse}/catalog.db",
+        warehouse=f"file://{warehouse}",
+    )
+    catalog.create_namespace("default")
+    return catalog
+
+
+def ticker_rows(tickers: list[str], pull_date: date) -> pa.Table:
+    prices = [random.uniform(10, 500) for _ in tickers]
+    return pa.table({
+        "ticker": tickers,
+        "date": [pull_date] * len(tickers),
+        "open": prices,
+        "close": prices,
+        "volume": [random.randint(1_000, 10_000_000) for _ in tickers],
+    }, schema=SCHEMA)
+
+
+def reset_table(catalog, tickers: list[str], pull_date: date):
+    if catalog.table_exists(TABLE_IDENTIFIER):
+        catalog.drop_table(TABLE_IDENTIFIER)
+
+    table = catalog.create_table(TABLE_IDENTIFIER, schema=SCHEMA)
+    with table.update_spec() as update:
+        update.add_field("date", MonthTransform(), "date_month")
+
+    if tickers:
+        table.append(ticker_rows(tickers, pull_date))
+
+
+class SimulatedRuns:
+    """
+    Stands in for tower.run_app and tower.wait_for_run. Each run of
+    write-ticker-data-to-iceberg takes run_secs and then appends rows for
+    its tickers.
+    """
+
+    def __init__(self, catalog, pull_date: date, run_secs: float):
+        self.catalog = catalog
+        self.pull_date = pull_date
+        self.run_secs = run_secs
+        self.runs = 0
+        self.lock = threading.Lock()
+
+    def run_app(self, name, parameters=None):
+        time.sleep(self.run_secs)
+        with self.lock:
+            self.runs += 1
+            table = self.catalog.load_table(TABLE_IDENTIFIER)
+            table.append(ticker_rows(parameters["TICKERS"].split(","), self.pull_date))
+        return SimpleNamespace(status_group="successful")
+
+    def wait_for_run(self, run):
+        return run
+
+
+def main():
+    sizes = [int(size) for size in os.getenv("BENCH_SIZES", "5,20,50").split(",")]
+    cached_fraction = float(os.getenv("BENCH_CACHED_FRACTION", "0.5"))
+    llm_latency_ms = int(os.getenv("BENCH_LLM_LATENCY_MS", "300"))
+    run_secs = float(os.getenv("BENCH_RUN_SECONDS", "1.0"))
+    policy = os.getenv("BENCH_POLICY", "batch")
+    verbose = os.getenv("BENCH_VERBOSE", "false").lower() == "true"
+    pull_date = date(2025, 6, 17)
+
+    catalog = local_catalog()
+    stub = StubLLM(policy=policy, latency_secs=llm_latency_ms / 1000)
+    server = start_server(stub)
+
+    agent.load_catalog = lambda name: catalog
+    runs = SimulatedRuns(catalog, pull_date, run_secs)
+    agent.tower.run_app = runs.run_app
+    agent.tower.wait_for_run = runs.wait_for_run
+
+    os.environ["INFERENCE_SERVER_BASE_URL"] = f"http://127.0.0.1:{server.server_port}/v1"
+    os.environ["MODEL_TO_USE"] = "stub"
+    os.environ["PULL_DATE"] = pull_date.isoformat()
+    os.environ.setdefault("USER_INPUT", "What was the stock price for each given ticker on a particular day?")
+
+    print(f"Policy: {policy}, preplan: {os.getenv('PREPLAN', 'false')}, "
+          f"LLM latency: {llm_latency_ms}ms, run time: {run_secs}s, cached: {cached_fraction:.0%}")
+    print(f"\n{'Tickers':>7} {'LLM calls':>9} {'Tool calls':>10} {'Runs':>5} {'Scans':>5} "
+          f"{'Preplan':>8} {'Agent':>8} {'Total':>8}")
+
+    for size in sizes:
+        tickers = [f"T{i:04d}" for i in range(size)]
+        reset_table(catalog, tickers[:int(size * cached_fraction)], pull_date)
+
+        agent.ticker_prices = agent.TickerPriceCache()
+        stub.reset()
+        runs.runs = 0
+        os.environ["TICKERS"] = ",".join(tickers)
+
+        output = contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO())
+        with output:
+            timings = agent.main()
+
+        print(f"{size:>7} {stub.requests:>9} {stub.tool_calls:>10} {runs.runs:>5} {agent.ticker_prices.scans:>5} "
+              f"{timings.get('preplan', 0.0):>7.2f}s {timings.get('agent', 0.0):>7.2f}s {timings['total']:>7.2f}s")
+
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
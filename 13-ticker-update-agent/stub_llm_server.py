@@ -0,0 +1,226 @@
+"""
+Local stub of an OpenAI-compatible inference server for the ticker update
+agent.
+
+The server answers `/v1/chat/completions` requests, streamed or not, with
+tool calls that follow the agent's business rules, so the agent loop can be
+run and benchmarked without a live model. It can also replay recorded
+assistant messages from a JSONL file, one OpenAI message per line, e.g.
+
+    {"content": null, "tool_calls": [{"id": "call_1", "type": "function", "function": {"name": "...", "arguments": "{...}"}}]}
+    {"content": "All tickers processed"}
+
+Every response is delayed by a configurable latency to stand in for model
+inference time.
+
+Usage:
+
+    STUB_POLICY=batch STUB_LATENCY_MS=300 uv run python stub_llm_server.py
+
+and run the agent with INFERENCE_SERVER_BASE_URL="http://127.0.0.1:8080/v1".
+"""
+
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StubLLM:
+    """
+    Produces the assistant messages of the stub server and counts the
+    requests and tool calls it has answered.
+
+    Args:
+        policy: "batch" to use the batch tools, "single" to call the
+            single-ticker tools for all tickers in parallel
+        latency_secs: Delay of every response
+        replay_file: JSONL file of recorded assistant messages to return in
+            order instead of the scripted policy
+    """
+
+    def __init__(self, policy: str = "batch", latency_secs: float = 0.0, replay_file: str = ""):
+        if policy not in ("batch", "single"):
+            raise ValueError(f"Unknown policy '{policy}', expected 'batch' or 'single'")
+
+        self.policy = policy
+        self.latency_secs = latency_secs
+        self.replay = []
+        if replay_file:
+            with open(replay_file) as f:
+                self.replay = [json.loads(line) for line in f if line.strip()]
+
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.requests = 0
+            self.tool_calls = 0
+            self.replay_position = 0
+
+    def reply(self, messages: list[dict]) -> dict:
+        time.sleep(self.latency_secs)
+
+        with self.lock:
+            self.requests += 1
+            if self.replay:
+                message = self.replay[self.replay_position % len(self.replay)]
+                self.replay_position += 1
+            else:
+                message = self.scripted_reply(messages)
+            self.tool_calls += len(message.get("tool_calls") or [])
+
+        return message
+
+    def scripted_reply(self, messages: list[dict]) -> dict:
+        last_user = max(i for i, message in enumerate(messages) if message["role"] == "user")
+        user_input = message_text(messages[last_user])
+        tool_results = [message_text(m) for m in messages[last_user + 1:] if m["role"] == "tool"]
+
+        tickers = re.search(r"Tickers: (.*)", user_input).group(1)
+        pull_date = re.search(r"Pull Date: (.*)", user_input).group(1).strip()
+        ticker_list = [ticker.strip() for ticker in tickers.split(",") if ticker.strip()]
+        preplanned = "already checked and are MISSING" in user_input
+        fetched = any("FETCHED" in result for result in tool_results)
+
+        if self.policy == "batch":
+            if not tool_results:
+                name = "fetch_and_store_data_for_tickers_into_database" if preplanned else "check_if_tickers_data_is_already_available"
+                return tool_calls_message([(name, {"PULL_DATE": pull_date, "TICKERS": ",".join(ticker_list)})])
+
+            missing = re.search(r"MISSING tickers: (\S+)", tool_results[-1])
+            if missing and not fetched:
+                return tool_calls_message([("fetch_and_store_data_for_tickers_into_database",
+                                            {"PULL_DATE": pull_date, "TICKERS": missing.group(1)})])
+        else:
+            if not tool_results:
+                name = "fetch_and_store_data_for_ticker_into_database" if preplanned else "check_if_ticker_data_is_already_available"
+                return tool_calls_message([(name, {"PULL_DATE": pull_date, "TICKER": ticker}) for ticker in ticker_list])
+
+            missing = [m.group(1) for m in (re.search(r"Data for (\S+) is MISSING", r) for r in tool_results) if m]
+            if missing and not fetched:
+                return tool_calls_message([("fetch_and_store_data_for_ticker_into_database",
+                                            {"PULL_DATE": pull_date, "TICKER": ticker}) for ticker in missing])
+
+        return {"content": "All tickers processed\n\n" + "\n".join(tool_results)}
+
+
+def message_text(message: dict) -> str:
+    content = message.get("content") or ""
+    if isinstance(content, list):
+        content = "".join(part.get("text", "") for part in content)
+    return content
+
+
+def tool_calls_message(calls: list[tuple[str, dict]]) -> dict:
+    return {
+        "content": None,
+        "tool_calls": [
+            {
+                "id": f"call_{uuid.uuid4().hex[:12]}",
+                "type": "function",
+                "function": {"name": name, "arguments": json.dumps(arguments)},
+            }
+            for name, arguments in calls
+        ],
+    }
+
+
+def make_handler(stub: StubLLM):
+
+    class Handler(BaseHTTPRequestHandler):
+
+        def do_GET(self):
+            if self.path.rstrip("/").endswith("/models"):
+                self.send_json({"object": "list", "data": [{"id": "stub", "object": "model", "owned_by": "stub"}]})
+            else:
+                self.send_error(404)
+
+        def do_POST(self):
+            if not self.path.rstrip("/").endswith("/chat/completions"):
+                self.send_error(404)
+                return
+
+            request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            message = stub.reply(request["messages"])
+            finish_reason = "tool_calls" if message.get("tool_calls") else "stop"
+            completion = {
+                "id": f"chatcmpl-{uuid.uuid4().hex[:12]}",
+                "created": int(time.time()),
+                "model": request.get("model", "stub"),
+            }
+
+            if not request.get("stream"):
+                self.send_json(completion | {
+                    "object": "chat.completion",
+                    "choices": [{"index": 0, "message": {"role": "assistant"} | message, "finish_reason": finish_reason}],
+                    "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+                })
+                return
+
+            delta = {"role": "assistant", "content": message.get("content")}
+            if message.get("tool_calls"):
+                delta["tool_calls"] = [call | {"index": i} for i, call in enumerate(message["tool_calls"])]
+
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.end_headers()
+            chunk = completion | {"object": "chat.completion.chunk"}
+            self.send_event(chunk | {"choices": [{"index": 0, "delta": delta, "finish_reason": None}]})
+            self.send_event(chunk | {"choices": [{"index": 0, "delta": {}, "finish_reason": finish_reason}]})
+            self.wfile.write(b"data: [DONE]\n\n")
+
+        def send_json(self, body: dict):
+            data = json.dumps(body).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def send_event(self, body: dict):
+            self.wfile.write(f"data: {json.dumps(body)}\n\n".encode())
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def start_server(stub: StubLLM, host: str = "127.0.0.1", port: int = 0) -> ThreadingHTTPServer:
+    """
+    Start the stub server in a background thread.
+
+    Args:
+        stub: Responses of the server
+        host: Host to listen on
+        port: Port to listen on, 0 for any free port
+
+    Returns:
+        The running server. Its base URL is
+        f"http://{host}:{server.server_port}/v1"
+    """
+    server = ThreadingHTTPServer((host, port), make_handler(stub))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    port = int(os.getenv("STUB_PORT", "8080"))
+    stub = StubLLM(
+        policy=os.getenv("STUB_POLICY", "batch"),
+        latency_secs=int(os.getenv("STUB_LATENCY_MS", "0")) / 1000,
+        replay_file=os.getenv("STUB_REPLAY_FILE", ""),
+    )
+
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(stub))
+    print(f"Stub inference server listening on http://127.0.0.1:{port}/v1")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -3,22 +3,102 @@ Tower Example: List Tables in an Iceberg Catalog
 
 This app connects to a Tower Iceberg catalog and lists all namespaces
 and tables within it, using the same catalog loading mechanism as Tower.
+
+Catalog requests run concurrently, up to MAX_CONCURRENCY at a time: the
+tables of all namespaces are listed in parallel, and with SHOW_DETAILS the
+tables are loaded as soon as their namespace has been listed. The output is
+printed once the crawl is done, sorted by name, so it is the same on every
+run.
 """
 
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from pyiceberg.catalog import load_catalog
 
 
-def list_catalog_contents(catalog_name: str = "default"):
+def timed(fn, *args) -> dict:
+    """
+    Call a catalog method and time it.
+
+    Returns:
+        Dict with the result or the error, and the time in seconds
+    """
+    start = time.perf_counter()
+    try:
+        result, error = fn(*args), None
+    except Exception as e:
+        result, error = None, e
+    return {"result": result, "error": error, "seconds": time.perf_counter() - start}
+
+
+def to_name(identifier) -> str:
+    return ".".join(identifier) if isinstance(identifier, tuple) else str(identifier)
+
+
+def crawl_catalog(catalog, namespaces: list, show_details: bool, max_concurrency: int) -> tuple[dict, dict]:
+    """
+    List the tables of all namespaces, and optionally load every table,
+    with at most max_concurrency catalog requests in flight.
+
+    Args:
+        catalog: PyIceberg catalog
+        namespaces: Namespaces to list
+        show_details: Whether to load the tables for their schemas
+        max_concurrency: Maximum number of concurrent catalog requests
+
+    Returns:
+        Dicts of namespace to its list_tables request, and of table
+        identifier to its load_table request, each as returned by timed()
+    """
+    listings = {}
+    loads = {}
+
+    with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+        pending = {executor.submit(timed, catalog.list_tables, ns): ("namespace", ns) for ns in namespaces}
+
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+
+            for future in done:
+                kind, key = pending.pop(future)
+                request = future.result()
+
+                if kind == "table":
+                    loads[key] = request
+                    continue
+
+                listings[key] = request
+                if show_details and request["error"] is None:
+                    for table_id in request["result"]:
+                        pending[executor.submit(timed, catalog.load_table, table_id)] = ("table", table_id)
+
+    return listings, loads
+
+
+def print_timings(label: str, requests: list[dict]):
+    if not requests:
+        return
+    seconds = sorted(request["seconds"] for request in requests)
+    p50 = seconds[len(seconds) // 2]
+    p95 = seconds[min(len(seconds) - 1, int(len(seconds) * 0.95))]
+    print(f"   {label}: {len(seconds)} requests, p50 {p50:.3f}s, p95 {p95:.3f}s, max {seconds[-1]:.3f}s")
+
+
+def list_catalog_contents(catalog_name: str = "default", show_details: bool = False,
+                          max_concurrency: int = 16, show_timings: bool = False):
     """
     Connect to a Tower Iceberg catalog and list all namespaces and tables.
-    
+
     Args:
         catalog_name: The name of the Tower catalog to connect to
+        show_details: Whether to show the schema of every table
+        max_concurrency: Maximum number of concurrent catalog requests
+        show_timings: Whether to show the time of every catalog request
     """
     print(f"Connecting to catalog: {catalog_name}")
     print("=" * 60)
-    
+
     # Load the catalog using PyIceberg's load_catalog
     # Tower sets up the required environment variables (PYICEBERG_CATALOG__*)
     # when running through `tower run`
@@ -30,70 +110,86 @@ def list_catalog_contents(catalog_name: str = "default"):
         print("  tower catalogs list")
         print("  tower catalogs create default")
         return
-    
+
     print(f"Catalog type: {type(catalog).__name__}")
-    
+
     # List all namespaces
     print("\n📁 NAMESPACES")
     print("-" * 40)
-    
+
     try:
-        namespaces = catalog.list_namespaces()
-        
+        start = time.perf_counter()
+        namespaces_request = timed(catalog.list_namespaces)
+        if namespaces_request["error"] is not None:
+            raise namespaces_request["error"]
+        namespaces = sorted(namespaces_request["result"], key=to_name)
+
         if not namespaces:
             print("  (no namespaces found)")
         else:
             for ns in namespaces:
-                namespace_name = ".".join(ns) if isinstance(ns, tuple) else str(ns)
-                print(f"  • {namespace_name}")
-        
-        # List tables in each namespace
+                print(f"  • {to_name(ns)}")
+
+        # List tables in each namespace, and load them for their details
+        listings, loads = crawl_catalog(catalog, namespaces, show_details, max_concurrency)
+        crawl_secs = time.perf_counter() - start
+
         print("\n📊 TABLES BY NAMESPACE")
         print("-" * 40)
-        
+
         total_tables = 0
-        
+
         for ns in namespaces:
-            namespace_name = ".".join(ns) if isinstance(ns, tuple) else str(ns)
-            
-            try:
-                tables = catalog.list_tables(ns)
-                
-                if tables:
-                    print(f"\n  [{namespace_name}]")
-                    for table_id in tables:
-                        table_name = table_id.name if hasattr(table_id, 'name') else str(table_id[-1]) if isinstance(table_id, tuple) else str(table_id)
-                        print(f"    └─ {table_name}")
-                        total_tables += 1
-                        
-                        # Optionally show table details
-                        show_details = os.environ.get("SHOW_DETAILS", "false").lower() == "true"
-                        if show_details:
-                            try:
-                                table = catalog.load_table(table_id)
-                                schema = table.schema()
-                                print(f"       Schema: {len(schema.fields)} columns")
-                                for field in schema.fields[:5]:  # Show first 5 columns
-                                    print(f"         - {field.name}: {field.field_type}")
-                                if len(schema.fields) > 5:
-                                    print(f"         ... and {len(schema.fields) - 5} more columns")
-                            except Exception as e:
-                                print(f"       (could not load schema: {e})")
-                else:
-                    print(f"\n  [{namespace_name}]")
-                    print("    (no tables)")
-                                
-            except Exception as e:
-                print(f"\n  [{namespace_name}]")
-                print(f"    (error listing tables: {e})")
-        
+            namespace_name = to_name(ns)
+            request = listings[ns]
+            timing = f" ({request['seconds']:.3f}s)" if show_timings else ""
+
+            print(f"\n  [{namespace_name}]{timing}")
+
+            if request["error"] is not None:
+                print(f"    (error listing tables: {request['error']})")
+                continue
+
+            tables = sorted(request["result"], key=to_name)
+            if not tables:
+                print("    (no tables)")
+                continue
+
+            for table_id in tables:
+                table_name = table_id.name if hasattr(table_id, 'name') else str(table_id[-1]) if isinstance(table_id, tuple) else str(table_id)
+                total_tables += 1
+
+                # Optionally show table details
+                if not show_details:
+                    print(f"    └─ {table_name}")
+                    continue
+
+                load = loads[table_id]
+                timing = f" ({load['seconds']:.3f}s)" if show_timings else ""
+                print(f"    └─ {table_name}{timing}")
+
+                if load["error"] is not None:
+                    print(f"       (could not load schema: {load['error']})")
+                    continue
+
+                schema = load["result"].schema()
+                print(f"       Schema: {len(schema.fields)} columns")
+                for field in schema.fields[:5]:  # Show first 5 columns
+                    print(f"         - {field.name}: {field.field_type}")
+                if len(schema.fields) > 5:
+                    print(f"         ... and {len(schema.fields) - 5} more columns")
+
         # Summary
         print("\n" + "=" * 60)
         print(f"📈 SUMMARY")
         print(f"   Namespaces: {len(namespaces)}")
         print(f"   Total Tables: {total_tables}")
+        print(f"   Crawl time: {crawl_secs:.2f}s (at most {max_concurrency} concurrent requests)")
+        print_timings("list_namespaces", [namespaces_request])
+        print_timings("list_tables", list(listings.values()))
+        print_timings("load_table", list(loads.values()))
         print("=" * 60)
-        
+
     except Exception as e:
         print(f"Error listing catalog contents: {e}")
         raise
@@ -101,7 +197,10 @@ def list_catalog_contents(catalog_name: str = "default"):
 
 def main():
     catalog_name = os.environ.get("CATALOG_NAME", "default")
-    list_catalog_contents(catalog_name)
+    show_details = os.environ.get("SHOW_DETAILS", "false").lower() == "true"
+    max_concurrency = int(os.environ.get("MAX_CONCURRENCY", "16"))
+    show_timings = os.environ.get("SHOW_TIMINGS", "false").lower() == "true"
+    list_catalog_contents(catalog_name, show_details, max_concurrency, show_timings)
 
 
 if __name__ == "__main__":
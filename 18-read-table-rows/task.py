@@ -3,11 +3,311 @@ Tower Example: Read First N Rows from an Iceberg Table
 
 This app reads the first N rows from a specified Iceberg table and displays
 them using Polars. The table and number of rows are configurable via parameters.
+
+The table is never read in full. The row count comes from the snapshot
+metadata, and data files are read one after another, row group by row group,
+until N rows are found. Optional COLUMNS and FILTER parameters are pushed
+down into the scan.
+
+OFFSET pages through the table, and SAMPLE_N or SAMPLE_FRACTION return a
+uniform random sample. Both locate their rows from the record counts of the
+data files in the manifests and the row group sizes in the Parquet footers,
+so only the row groups that hold the rows are read.
 """
 
-import tower
 import polars as pl
+import pyarrow as pa
+import pyarrow.parquet as pq
+import bisect
 import os
+import random
+import time
+
+from pyiceberg.catalog import load_catalog
+from pyiceberg.expressions import AlwaysTrue
+from pyiceberg.io.pyarrow import ArrowScan, schema_to_pyarrow
+from pyiceberg.manifest import FileFormat
+
+
+def total_row_count(iceberg_table) -> tuple[int, int]:
+    """
+    Get the number of rows in the table from the current snapshot's
+    summary, without reading any data files. If the summary has no totals,
+    the record counts of the data files in the manifests are added up.
+
+    Args:
+        iceberg_table: PyIceberg table
+
+    Returns:
+        The number of rows in the data files and the number of deleted rows
+        in delete files, which are not subtracted
+    """
+    snapshot = iceberg_table.current_snapshot()
+    if snapshot is None:
+        return 0, 0
+
+    # Summary.get returns None for a missing key, whatever the default
+    summary = snapshot.summary
+    if summary.get("total-records") is not None:
+        deletes = int(summary.get("total-position-deletes") or 0) + int(summary.get("total-equality-deletes") or 0)
+        return int(summary.get("total-records")), deletes
+
+    tasks = list(iceberg_table.scan().plan_files())
+    delete_files = {delete_file.file_path: delete_file for task in tasks for delete_file in task.delete_files}
+    return (
+        sum(task.file.record_count for task in tasks),
+        sum(delete_file.record_count for delete_file in delete_files.values()),
+    )
+
+
+class MissingFieldIdsError(Exception):
+    """
+    A data file has no Iceberg field ids, e.g. a file imported with
+    add_files, so its columns cannot be matched to the table by id.
+    """
+
+
+def can_seek(tasks: list, row_filter) -> bool:
+    """
+    Whether rows can be located from the per-file record counts in the
+    manifests. This is the case when every row of the planned files is
+    part of the result: there is no filter and there are no delete files.
+
+    The data files also need Iceberg field ids, which is only known once
+    their footers are read; read_file_rows raises MissingFieldIdsError for
+    a file without them.
+    """
+    return (
+        isinstance(row_filter, AlwaysTrue)
+        and all(task.file.file_format == FileFormat.PARQUET and not task.delete_files for task in tasks)
+    )
+
+
+def read_file_rows(iceberg_table, task, projected_schema, row_positions: list[int]) -> pa.Table:
+    """
+    Read rows at the given positions of a Parquet data file.
+
+    Only the row groups that contain the positions are read, found from the
+    row group sizes in the file footer. Columns are matched to the table
+    schema by their Iceberg field ids, so renamed columns are read
+    correctly, and columns added after the file was written are null.
+
+    Args:
+        iceberg_table: PyIceberg table
+        task: FileScanTask of the data file
+        projected_schema: Iceberg schema of the columns to read
+        row_positions: Sorted positions of the rows in the file
+
+    Returns:
+        The rows, in the order of row_positions
+
+    Raises:
+        MissingFieldIdsError: If the file has no Iceberg field ids
+    """
+    target_schema = schema_to_pyarrow(projected_schema, include_field_ids=False)
+
+    with iceberg_table.io.new_input(task.file.file_path).open() as f:
+        parquet_file = pq.ParquetFile(f)
+
+        names_by_field_id = {
+            int(field.metadata[b"PARQUET:field_id"]): field.name
+            for field in parquet_file.schema_arrow
+            if field.metadata and b"PARQUET:field_id" in field.metadata
+        }
+        if not names_by_field_id:
+            raise MissingFieldIdsError(f"{task.file.file_path} has no Iceberg field ids")
+        file_columns = [names_by_field_id.get(field.field_id) for field in projected_schema.fields]
+
+        row_group_starts = []
+        num_rows = 0
+        for i in range(parquet_file.metadata.num_row_groups):
+            row_group_starts.append(num_rows)
+            num_rows += parquet_file.metadata.row_group(i).num_rows
+
+        row_groups = sorted({bisect.bisect_right(row_group_starts, pos) - 1 for pos in row_positions})
+        data = parquet_file.read_row_groups(row_groups, columns=[col for col in file_columns if col is not None])
+
+    # Positions of the rows within the row groups that were read
+    offset_in_data = {}
+    offset = 0
+    for row_group in row_groups:
+        offset_in_data[row_group] = offset
+        offset += parquet_file.metadata.row_group(row_group).num_rows
+
+    indices = [
+        offset_in_data[row_group] + pos - row_group_starts[row_group]
+        for pos in row_positions
+        for row_group in [bisect.bisect_right(row_group_starts, pos) - 1]
+    ]
+    rows = data.take(pa.array(indices, type=pa.int64()))
+
+    arrays = [
+        rows.column(col) if col is not None else pa.nulls(rows.num_rows, type=field.type)
+        for col, field in zip(file_columns, target_schema)
+    ]
+    return pa.Table.from_arrays(arrays, schema=target_schema)
+
+
+def scan_rows(iceberg_table, scan, tasks: list, num_rows: int | None) -> tuple[list[pa.RecordBatch], int]:
+    """
+    Read the first num_rows rows of the scan, or all rows if num_rows is
+    None.
+
+    Data files are read one at a time, and each only up to the rows still
+    missing, so reading stops at the first row groups that complete the
+    result.
+
+    Returns:
+        The rows and the number of data files that were opened
+    """
+    batches = []
+    rows_read = 0
+    files_read = 0
+
+    for task in tasks:
+        if num_rows is not None and rows_read >= num_rows:
+            break
+
+        arrow_scan = ArrowScan(
+            iceberg_table.metadata,
+            iceberg_table.io,
+            scan.projection(),
+            scan.row_filter,
+            scan.case_sensitive,
+            limit=None if num_rows is None else num_rows - rows_read,
+        )
+        for batch in arrow_scan.to_record_batches([task]):
+            batches.append(batch)
+            rows_read += batch.num_rows
+        files_read += 1
+
+    return batches, files_read
+
+
+def to_table(pieces: list, projected_schema) -> pa.Table:
+    target_schema = schema_to_pyarrow(projected_schema, include_field_ids=False)
+    tables = [
+        piece if isinstance(piece, pa.Table) else pa.Table.from_batches([piece])
+        for piece in pieces
+    ]
+    return pa.concat_tables([table.cast(target_schema) for table in tables if table.num_rows]
+                            or [target_schema.empty_table()])
+
+
+def read_positions(iceberg_table, tasks: list, projected_schema, positions) -> tuple[pa.Table, int]:
+    """
+    Read the rows at the given positions of the table, counting rows across
+    the planned files in order. Files without any of the positions are
+    skipped without being opened.
+
+    Args:
+        iceberg_table: PyIceberg table
+        tasks: Planned files of the scan
+        projected_schema: Iceberg schema of the columns to read
+        positions: Sorted positions of the rows in the table
+
+    Returns:
+        The rows, in table order, and the number of data files that were
+        opened
+
+    Raises:
+        MissingFieldIdsError: If a file that holds some of the rows has no
+            Iceberg field ids
+    """
+    pieces = []
+    file_start = 0
+    next_position = 0
+
+    for task in tasks:
+        if next_position == len(positions):
+            break
+        file_end = file_start + task.file.record_count
+        first = next_position
+        while next_position < len(positions) and positions[next_position] < file_end:
+            next_position += 1
+        if next_position > first:
+            file_positions = [pos - file_start for pos in positions[first:next_position]]
+            pieces.append(read_file_rows(iceberg_table, task, projected_schema, file_positions))
+        file_start = file_end
+
+    return to_table(pieces, projected_schema), len(pieces)
+
+
+def read_rows(iceberg_table, scan, tasks: list, offset: int, num_rows: int) -> tuple[pa.Table, int]:
+    """
+    Read num_rows rows starting at offset.
+
+    When the rows can be located from the record counts in the manifests,
+    the files before the offset are skipped without being opened, and only
+    the row groups that hold the page are read. Otherwise, or if a data
+    file has no Iceberg field ids, the scan is read from the start and the
+    rows before the offset are discarded.
+
+    Args:
+        iceberg_table: PyIceberg table
+        scan: Scan with the columns and filter to read
+        tasks: Planned files of the scan
+        offset: Number of rows to skip
+        num_rows: Number of rows to read
+
+    Returns:
+        The rows and the number of data files that were opened
+    """
+    projected_schema = scan.projection()
+
+    if can_seek(tasks, scan.row_filter):
+        total_rows = sum(task.file.record_count for task in tasks)
+        positions = range(min(offset, total_rows), min(offset + num_rows, total_rows))
+        try:
+            return read_positions(iceberg_table, tasks, projected_schema, positions)
+        except MissingFieldIdsError as e:
+            print(f"  Note: {e}, reading the scan from the start")
+
+    batches, files_read = scan_rows(iceberg_table, scan, tasks, offset + num_rows)
+    return to_table(batches, projected_schema).slice(offset, num_rows), files_read
+
+
+def sample_rows(iceberg_table, scan, tasks: list, sample_n: int, sample_fraction: float,
+                seed: int | None) -> tuple[pa.Table, int]:
+    """
+    Read a uniform random sample of rows.
+
+    When the rows can be located from the record counts in the manifests,
+    the row positions are drawn over the whole table, and only the row
+    groups that hold them are read. Otherwise, or if a data file has no
+    Iceberg field ids, all matching rows are read and sampled.
+
+    Args:
+        iceberg_table: PyIceberg table
+        scan: Scan with the columns and filter to read
+        tasks: Planned files of the scan
+        sample_n: Number of rows to sample, 0 to use sample_fraction
+        sample_fraction: Fraction of the rows to sample
+        seed: Seed of the random generator, None for a random sample
+
+    Returns:
+        The sampled rows, in table order, and the number of data files
+        that were opened
+    """
+    projected_schema = scan.projection()
+    rng = random.Random(seed)
+
+    if can_seek(tasks, scan.row_filter):
+        total_rows = sum(task.file.record_count for task in tasks)
+        n = sample_n or round(sample_fraction * total_rows)
+        positions = sorted(rng.sample(range(total_rows), min(n, total_rows)))
+        try:
+            return read_positions(iceberg_table, tasks, projected_schema, positions)
+        except MissingFieldIdsError as e:
+            print(f"  Note: {e}, sampling reads all rows")
+    else:
+        print("  Note: sampling reads all matching rows, because FILTER is set or the table has delete files")
+
+    batches, files_read = scan_rows(iceberg_table, scan, tasks, None)
+    data = pl.from_arrow(to_table(batches, projected_schema)).with_row_index()
+    n = sample_n or round(sample_fraction * data.height)
+    sample = data.sample(n=min(n, data.height), seed=seed).sort("index").drop("index")
+    return sample.to_arrow(), files_read
 
 
 def main():
@@ -16,21 +316,39 @@ def main():
     namespace = os.getenv("NAMESPACE", "default")
     table_name = os.getenv("TABLE_NAME", "daily_ticker_data")
     num_rows = int(os.getenv("NUM_ROWS", "10"))
-    
+    columns_str = os.getenv("COLUMNS", "")
+    filter_str = os.getenv("FILTER", "")
+    offset = int(os.getenv("OFFSET", "0"))
+    sample_n = int(os.getenv("SAMPLE_N", "0"))
+    sample_fraction = float(os.getenv("SAMPLE_FRACTION", "0"))
+    sample_seed_str = os.getenv("SAMPLE_SEED", "")
+
+    sampling = sample_n > 0 or sample_fraction > 0
+    sample_seed = int(sample_seed_str) if sample_seed_str else None
+
+    columns = tuple(col.strip() for col in columns_str.split(",") if col.strip()) or ("*",)
+    row_filter = filter_str if filter_str else AlwaysTrue()
+
     print("=" * 60)
     print("📊 READ TABLE ROWS")
     print("=" * 60)
     print(f"Catalog: {catalog_name}")
     print(f"Table: {namespace}.{table_name}")
-    print(f"Rows to fetch: {num_rows}")
+    if sampling:
+        print(f"Sample: {sample_n} rows" if sample_n else f"Sample: {sample_fraction:.4%} of rows")
+    else:
+        print(f"Rows to fetch: {num_rows} from row {offset}")
+    if columns_str:
+        print(f"Columns: {', '.join(columns)}")
+    if filter_str:
+        print(f"Filter: {filter_str}")
     print("=" * 60)
-    
-    # Load the table using Tower tables SDK
+
+    start = time.perf_counter()
+
+    # Load the table from the catalog that Tower configures for the environment
     try:
-        if namespace and namespace != "default":
-            df = tower.tables(table_name, namespace=namespace, catalog=catalog_name).load().read()
-        else:
-            df = tower.tables(table_name, catalog=catalog_name).load().read()
+        iceberg_table = load_catalog(catalog_name).load_table((namespace, table_name))
     except Exception as e:
         print(f"\n❌ Error loading table: {e}")
         print("\nMake sure:")
@@ -38,36 +356,55 @@ def main():
         print(f"  2. The catalog '{catalog_name}' is configured in your Tower environment")
         print("  3. Run 'tower run --local --environment=<env>' with the right environment")
         return
-    
-    total_rows = len(df)
+
+    total_rows, deleted_rows = total_row_count(iceberg_table)
     print(f"\n✓ Table loaded successfully")
     print(f"  Total rows in table: {total_rows}")
-    
-    # Get the first N rows
-    result_df = df.head(num_rows)
+    if deleted_rows:
+        print(f"  Rows in delete files: {deleted_rows} (not subtracted from the total)")
+
+    # Get a page of rows, or a sample
+    try:
+        scan = iceberg_table.scan(row_filter=row_filter, selected_fields=columns)
+        tasks = list(scan.plan_files())
+        if sampling:
+            result, files_read = sample_rows(iceberg_table, scan, tasks, sample_n, sample_fraction, sample_seed)
+        else:
+            result, files_read = read_rows(iceberg_table, scan, tasks, offset, num_rows)
+    except Exception as e:
+        print(f"\n❌ Error reading rows: {e}")
+        print("\nCheck the COLUMNS and FILTER parameters, e.g. COLUMNS=\"ticker,close\" FILTER=\"ticker == 'AAPL'\"")
+        return
+
+    result_df = pl.from_arrow(result)
     actual_rows = len(result_df)
-    
+
     print(f"  Rows returned: {actual_rows}")
-    
+    print(f"  Data files read: {files_read} of {len(tasks)}")
+    print(f"  Time: {time.perf_counter() - start:.2f}s")
+
     # Display schema
-    print(f"\n📋 SCHEMA ({len(df.columns)} columns)")
+    print(f"\n📋 SCHEMA ({len(result_df.columns)} columns)")
     print("-" * 40)
-    for col_name, col_type in df.schema.items():
+    for col_name, col_type in result_df.schema.items():
         print(f"  {col_name}: {col_type}")
-    
+
     # Display the data
-    print(f"\n📄 DATA (first {actual_rows} rows)")
+    if sampling:
+        print(f"\n📄 DATA (sample of {actual_rows} rows)")
+    else:
+        print(f"\n📄 DATA (rows {offset} to {offset + actual_rows - 1})" if actual_rows else "\n📄 DATA (no rows)")
     print("-" * 40)
-    
+
     # Configure Polars display options for better output
     with pl.Config(
-        tbl_rows=num_rows,
+        tbl_rows=actual_rows,
         tbl_cols=20,
         fmt_str_lengths=50,
         tbl_width_chars=120
     ):
         print(result_df)
-    
+
     print("\n" + "=" * 60)
     print("✓ Done!")
     print("=" * 60)